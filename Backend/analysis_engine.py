@@ -0,0 +1,429 @@
+# Backend/analysis_engine.py
+
+import os
+import json
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+from llm_client import call_gemini_api
+from rate_limiter import PRIORITY_ANALYSIS
+from single_flight import single_flight, make_flight_key
+from retrieval import select_relevant_pages, select_relevant_sections, RETRIEVAL_ENABLED
+from sections import materialize_sections, ground_top_sections, SECTION_CHUNKING_ENABLED
+from token_budget import estimate_tokens, truncate_to_tokens, make_segment, pack_segments, prompt_budget
+
+logger = logging.getLogger(__name__)
+
+# --- Map-Reduce Settings ---
+# Above this many (estimated) context tokens the analysis switches to map-reduce
+MAP_REDUCE_TOKEN_THRESHOLD = int(os.getenv("MAP_REDUCE_TOKEN_THRESHOLD", 120_000))
+MAP_CHUNK_TOKENS = int(os.getenv("MAP_CHUNK_TOKENS", 30_000))
+MAP_CONCURRENCY = int(os.getenv("MAP_CONCURRENCY", 4))
+# Room left in every analysis prompt for the instructions around the context
+PROMPT_OVERHEAD_TOKENS = 1500
+REDUCE_MAX_CANDIDATES = int(os.getenv("REDUCE_MAX_CANDIDATES", 40))
+
+# --- Incremental Re-Analysis Settings ---
+INCREMENTAL_ANALYSIS_ENABLED = os.getenv("INCREMENTAL_ANALYSIS_ENABLED", "true").lower() == "true"
+MERGED_TOP_SECTIONS = int(os.getenv("MERGED_TOP_SECTIONS", 5))
+
+ANALYSIS_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "top_sections": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "importance_rank": {"type": "INTEGER"},
+                    "document": {"type": "STRING"},
+                    "page_number": {"type": "INTEGER"},
+                    "section_title": {"type": "STRING"},
+                    "subsection_analysis": {"type": "STRING", "description": "A relevant snippet from the section."},
+                    "reasoning": {"type": "STRING"}
+                }, "required": ["importance_rank", "document", "page_number", "section_title", "subsection_analysis", "reasoning"]
+            }
+        },
+        "llm_insights": {
+            "type": "OBJECT",
+            "properties": {
+                "key_insights": {"type": "ARRAY", "items": {"type": "STRING"}},
+                "did_you_know": {"type": "ARRAY", "items": {"type": "STRING"}},
+                "cross_document_connections": {"type": "ARRAY", "items": {"type": "STRING"}}
+            }, "required": ["key_insights", "did_you_know", "cross_document_connections"]
+        }
+    }, "required": ["top_sections", "llm_insights"]
+}
+
+MAP_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "is_relevant": {"type": "BOOLEAN"},
+        "relevance_reason": {"type": "STRING"},
+        "candidate_sections": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "document": {"type": "STRING"},
+                    "page_number": {"type": "INTEGER"},
+                    "section_title": {"type": "STRING"},
+                    "subsection_analysis": {"type": "STRING", "description": "A relevant snippet from the section."},
+                    "relevance_score": {"type": "INTEGER", "description": "0-10, how directly this section serves the goal."},
+                    "reasoning": {"type": "STRING"}
+                }, "required": ["document", "page_number", "section_title", "subsection_analysis", "relevance_score", "reasoning"]
+            }
+        },
+        "notes": {"type": "ARRAY", "items": {"type": "STRING"}}
+    }, "required": ["is_relevant", "relevance_reason", "candidate_sections", "notes"]
+}
+
+
+class ErrorAnalysis(dict):
+    """Fallback analysis returned when the LLM calls fail; serializes like any other analysis."""
+
+
+def error_analysis(e: Exception) -> Dict[str, Any]:
+    return ErrorAnalysis({"top_sections": [],"llm_insights": {"key_insights": [f"Error during analysis: {e}"],"did_you_know": [],"cross_document_connections": ["Could not establish connections due to an error."]}})
+
+
+def is_publishable_analysis(result: Any) -> bool:
+    """Error fallbacks are not shared through single-flight, so other workers retry instead of reusing them."""
+    return not isinstance(result, ErrorAnalysis)
+
+
+def iter_pages(doc: Dict[str, Any]):
+    """Yields (page_number, text); retrieval-narrowed documents carry explicit page numbers."""
+    page_numbers = doc.get("page_numbers") or range(1, len(doc["pages"]) + 1)
+    return zip(page_numbers, doc["pages"])
+
+
+def format_page(doc_name: str, page_num: int, text: str) -> str:
+    return f"--- START OF PAGE {page_num} in {doc_name} ---\n{text}\n--- END OF PAGE {page_num} in {doc_name} ---\n"
+
+
+def format_section(doc_name: str, section: Dict[str, Any]) -> str:
+    # Keeps the page-marker prefix so the page number instructions in the prompts still apply
+    return (f"--- START OF PAGE {section['page_start']} in {doc_name} | SECTION ({section['level']}): {section['title']} ---\n"
+            f"{section['text']}\n--- END OF SECTION {section['title']} in {doc_name} ---\n")
+
+
+def iter_blocks(doc: Dict[str, Any]):
+    """Yields (first_page, rendered_text) per heading section when the document has them, else per page."""
+    if doc.get("sections") and "text" in doc["sections"][0]:
+        for section in doc["sections"]:
+            yield section["page_start"], format_section(doc["name"], section)
+    else:
+        for page_num, text in iter_pages(doc):
+            yield page_num, format_page(doc["name"], page_num, text)
+
+
+def build_full_text_context(documents: List[Dict[str, Any]]) -> str:
+    """
+    Renders extracted documents into the single-prompt context. Newly uploaded
+    documents are marked page by page; previously uploaded ones as full text.
+    """
+    context_parts = []
+    for doc in documents:
+        if doc.get("is_new", True):
+            context_parts.extend(block for _, block in iter_blocks(doc))
+        else:
+            text = "".join(doc["pages"])
+            context_parts.append(f"--- START OF FULL TEXT for {doc['name']} ---\n{text}\n--- END OF FULL TEXT for {doc['name']} ---\n")
+    return "\n".join(context_parts)
+
+
+# ==============================================================================
+# Core Analysis Function
+# ==============================================================================
+@single_flight("analysis", publish_if=is_publishable_analysis)
+async def generate_connected_analysis(full_text_context: str, persona: str, job_to_be_done: str) -> Dict[str, Any]:
+    prompt = f"""
+    You are an expert research assistant acting as a '{persona}' whose goal is to '{job_to_be_done}'.
+    Analyze the provided context, which contains the full text from one or more documents.
+    *Your Reasoning Process:*
+    1. *Assess Relevance:* First, review the user's goal: '{job_to_be_done}'. Now, read through all the provided document texts. Decide which documents are relevant to this goal and which are not.
+    2. *Extract Initial Insights:* From the documents you identified as RELEVANT, extract the top 5 most important sections that directly address the user's goal. These will populate the 'top_sections' of the JSON response.Also , for each section, provide:subsections as it is from the pdf. When you extract a section, also include the page number.
+The page number is indicated in the provided context between markers like:
+--- START OF PAGE 3 in MyDoc.pdf --- ... --- END OF PAGE 3 in MyDoc.pdf ---.
+Always copy this page number into the "page_number" field in the JSON..
+When the marker also names a SECTION, use that heading as the "section_title".
+    3. *Synthesize Connected Insights:* Now, consider all the RELEVANT documents together. Generate the deeper insights for the 'llm_insights' section.
+        - *cross_document_connections*: This is the most critical part. Find connections, patterns, or contradictions between all the relevant materials. Explicitly state which documents you used and which you ignored (and why). For example: "I have ignored Lunch.pdf as it was not relevant to the goal of creating a dinner menu."
+    *Provided Context:*
+    {full_text_context}
+    *Instructions:*
+    Respond ONLY with a single JSON object that strictly adheres to the specified schema. Your response must be based on fulfilling the user's goal using only the relevant documents from the context.
+    """
+    payload = {"contents": [{"parts": [{"text": prompt}]}],"generationConfig": {"responseMimeType": "application/json", "responseSchema": ANALYSIS_SCHEMA}}
+    try:
+        response_json = await call_gemini_api(payload, priority=PRIORITY_ANALYSIS)
+        return json.loads(response_json['candidates'][0]['content']['parts'][0]['text'])
+    except Exception as e:
+        logger.error(f"Failed to generate connected analysis: {e}")
+        return error_analysis(e)
+
+
+# ==============================================================================
+# Map-Reduce Analysis
+# ==============================================================================
+def map_chunk_tokens() -> int:
+    return min(MAP_CHUNK_TOKENS, prompt_budget() - PROMPT_OVERHEAD_TOKENS)
+
+
+def split_into_map_chunks(documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Splits each document into runs of whole sections (or pages) that fit the
+    map chunk budget; a single oversized block is trimmed.
+    """
+    chunk_tokens = map_chunk_tokens()
+    chunks = []
+    for doc in documents:
+        current, current_tokens, first_page = [], 0, None
+        for page_num, page_text in iter_blocks(doc):
+            first_page = first_page or page_num
+            tokens = estimate_tokens(page_text)
+            if tokens > chunk_tokens:
+                page_text = truncate_to_tokens(page_text, chunk_tokens - 100)
+                tokens = estimate_tokens(page_text)
+            if current and current_tokens + tokens > chunk_tokens:
+                chunks.append({"document": doc["name"], "first_page": first_page, "text": "\n".join(current)})
+                current, current_tokens, first_page = [], 0, page_num
+            current.append(page_text)
+            current_tokens += tokens
+        if current:
+            chunks.append({"document": doc["name"], "first_page": first_page, "text": "\n".join(current)})
+    return chunks
+
+
+async def map_chunk(chunk: Dict[str, Any], persona: str, job_to_be_done: str) -> Dict[str, Any]:
+    """Map step: extracts candidate sections and notes from one document chunk."""
+    prompt = f"""
+    You are an expert research assistant acting as a '{persona}' whose goal is to '{job_to_be_done}'.
+    Below is part of the document '{chunk['document']}'. Other documents are being reviewed separately.
+    1. Decide whether this text is relevant to the goal and briefly say why.
+    2. Extract up to 5 candidate sections that directly address the goal. Copy the page number from the
+       --- START OF PAGE n in ... --- markers into "page_number" and quote a relevant snippet as "subsection_analysis".
+       When the marker also names a SECTION, use that heading as "section_title".
+    3. Write short notes with the facts from this text that matter for the goal, so they can be compared with other documents later.
+    *Document Text:*
+    {chunk['text']}
+    Respond ONLY with a single JSON object that strictly adheres to the specified schema.
+    """
+    payload = {"contents": [{"parts": [{"text": prompt}]}],"generationConfig": {"responseMimeType": "application/json", "responseSchema": MAP_SCHEMA}}
+    response_json = await call_gemini_api(payload, priority=PRIORITY_ANALYSIS)
+    result = json.loads(response_json['candidates'][0]['content']['parts'][0]['text'])
+    result["document"] = chunk["document"]
+    return result
+
+
+async def reduce_map_results(map_results: List[Dict[str, Any]], persona: str, job_to_be_done: str) -> Dict[str, Any]:
+    """Reduce step: merges per-chunk candidates and notes into the final analysis schema."""
+    candidates = [c for r in map_results for c in r.get("candidate_sections", [])]
+    candidates.sort(key=lambda c: c.get("relevance_score", 0), reverse=True)
+    candidates_json = json.dumps(candidates[:REDUCE_MAX_CANDIDATES], ensure_ascii=False)
+    documents = {}
+    for r in map_results:
+        doc = documents.setdefault(r["document"], {"document": r["document"], "is_relevant": False, "relevance_reasons": [], "notes": []})
+        doc["is_relevant"] = doc["is_relevant"] or r.get("is_relevant", False)
+        doc["relevance_reasons"].append(r.get("relevance_reason", ""))
+        doc["notes"].extend(r.get("notes", []))
+    # Notes of relevant documents are packed first; what does not fit the prompt budget is left out
+    note_segments = [make_segment(json.dumps(doc, ensure_ascii=False), priority=0 if doc["is_relevant"] else 1, trimmable=False)
+                     for doc in documents.values()]
+    notes_budget = prompt_budget() - PROMPT_OVERHEAD_TOKENS - estimate_tokens(candidates_json)
+    packed_notes, _ = pack_segments(note_segments, notes_budget)
+    notes_json = "[" + ", ".join(segment["text"] for segment in packed_notes) + "]"
+
+    prompt = f"""
+    You are an expert research assistant acting as a '{persona}' whose goal is to '{job_to_be_done}'.
+    The documents were reviewed one at a time. You are given, for each document, whether it was judged relevant and
+    the notes taken from it, plus the best candidate sections found across all documents.
+    1. From the candidate sections, choose the top 5 that most directly address the goal and rank them for 'top_sections'.
+       Keep their document, page_number, section_title and subsection_analysis exactly as given.
+    2. Generate 'llm_insights' from the notes of the RELEVANT documents.
+        - *cross_document_connections*: Find connections, patterns, or contradictions between the relevant documents.
+          Explicitly state which documents you used and which you ignored (and why).
+    *Per-Document Notes:*
+    {notes_json}
+    *Candidate Sections:*
+    {candidates_json}
+    Respond ONLY with a single JSON object that strictly adheres to the specified schema.
+    """
+    payload = {"contents": [{"parts": [{"text": prompt}]}],"generationConfig": {"responseMimeType": "application/json", "responseSchema": ANALYSIS_SCHEMA}}
+    response_json = await call_gemini_api(payload, priority=PRIORITY_ANALYSIS)
+    return json.loads(response_json['candidates'][0]['content']['parts'][0]['text'])
+
+
+def map_reduce_flight_key(documents: List[Dict[str, Any]], persona: str, job_to_be_done: str) -> Optional[str]:
+    """
+    Identifies a map-reduce call by each document's content hash and the pages or
+    section boundaries it was narrowed to, instead of hashing the full text.
+    Documents without a hash skip coalescing.
+    """
+    identities = []
+    for doc in documents:
+        if not doc.get("sha256"):
+            return None
+        sections = doc.get("sections") if doc.get("sections") and "text" in doc["sections"][0] else None
+        if sections:
+            selected = [[s["page_start"], s.get("start"), s.get("page_end"), s.get("end"), s["title"]] for s in sections]
+        else:
+            selected = list(doc.get("page_numbers") or range(1, len(doc["pages"]) + 1))
+        identities.append([doc["name"], doc["sha256"], selected])
+    return make_flight_key(identities, persona, job_to_be_done)
+
+
+@single_flight("analysis-map-reduce", key_func=map_reduce_flight_key, publish_if=is_publishable_analysis)
+async def generate_map_reduce_analysis(documents: List[Dict[str, Any]], persona: str, job_to_be_done: str) -> Dict[str, Any]:
+    chunks = split_into_map_chunks(documents)
+    semaphore = asyncio.Semaphore(MAP_CONCURRENCY)
+
+    async def run(chunk):
+        async with semaphore:
+            return await map_chunk(chunk, persona, job_to_be_done)
+
+    logger.info(f"Running map-reduce analysis over {len(documents)} documents in {len(chunks)} chunks.")
+    results = await asyncio.gather(*(run(chunk) for chunk in chunks), return_exceptions=True)
+    map_results = []
+    for chunk, result in zip(chunks, results):
+        if isinstance(result, Exception):
+            # A failed chunk only loses its own candidates instead of failing the whole analysis
+            logger.error(f"Map step failed for {chunk['document']} (from page {chunk['first_page']}): {result}")
+            continue
+        map_results.append(result)
+    if not map_results:
+        return error_analysis(RuntimeError("every map step failed"))
+    try:
+        return await reduce_map_results(map_results, persona, job_to_be_done)
+    except Exception as e:
+        logger.error(f"Failed to reduce map-reduce analysis: {e}")
+        return error_analysis(e)
+
+
+async def run_connected_analysis(documents: List[Dict[str, Any]], persona: str, job_to_be_done: str) -> Dict[str, Any]:
+    """
+    Analyzes extracted documents. Documents are split into heading-delimited
+    sections (pages when there is no outline), narrowed to the ones most relevant
+    to the persona and job (BM25 retrieval), then the analysis switches to
+    map-reduce automatically when the context still exceeds
+    MAP_REDUCE_TOKEN_THRESHOLD or the configured model's prompt budget.
+    Finally top_sections are tied back to real outline headings.
+    """
+    source_documents = documents
+    query = f"{persona} {job_to_be_done}"
+    use_sections = SECTION_CHUNKING_ENABLED and all(doc.get("sections") for doc in documents)
+    if use_sections:
+        documents = [{**doc, "sections": materialize_sections(doc)} for doc in documents]
+    if RETRIEVAL_ENABLED:
+        select = select_relevant_sections if use_sections else select_relevant_pages
+        documents = await asyncio.to_thread(select, documents, query)
+    full_text_context = build_full_text_context(documents)
+    context_tokens = estimate_tokens(full_text_context)
+    if context_tokens > min(MAP_REDUCE_TOKEN_THRESHOLD, prompt_budget() - PROMPT_OVERHEAD_TOKENS):
+        logger.info(f"Context is ~{context_tokens} tokens; using map-reduce analysis.")
+        analysis = await generate_map_reduce_analysis(documents, persona, job_to_be_done)
+    else:
+        analysis = await generate_connected_analysis(full_text_context, persona, job_to_be_done)
+    return ground_top_sections(analysis, source_documents) if use_sections else analysis
+
+
+# ==============================================================================
+# Incremental Re-Analysis
+# ==============================================================================
+def find_changed_documents(documents: List[Dict[str, Any]], previous_metadata: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Documents that are new to the session or whose content hash differs from the
+    one recorded at the last analysis. Sessions analyzed before hashes were
+    recorded only have `input_documents`; their documents count as unchanged
+    unless they were just re-uploaded.
+    """
+    previous_names = set(previous_metadata.get("input_documents", []))
+    previous_hashes = previous_metadata.get("document_hashes", {})
+    changed = []
+    for doc in documents:
+        if doc["name"] not in previous_names:
+            changed.append(doc)
+        elif doc["name"] in previous_hashes:
+            if previous_hashes[doc["name"]] != doc.get("sha256"):
+                changed.append(doc)
+        elif doc.get("is_new"):
+            changed.append(doc)
+    return changed
+
+
+def can_merge_into(previous_analysis: Dict[str, Any], persona: str, job_to_be_done: str) -> bool:
+    """An earlier analysis can only be extended if it answered the same persona and job."""
+    metadata = previous_analysis.get("metadata", {})
+    return bool(previous_analysis.get("top_sections")) and metadata.get("persona") == persona and metadata.get("job_to_be_done") == job_to_be_done
+
+
+def merge_analyses_locally(previous: Dict[str, Any], delta: Dict[str, Any], replaced: set) -> Dict[str, Any]:
+    """Deterministic merge used when the merge call fails: interleaves both rankings and concatenates insights."""
+    kept = [s for s in previous.get("top_sections", []) if s.get("document") not in replaced]
+    ranked = sorted(enumerate(kept + delta.get("top_sections", [])), key=lambda item: (item[1].get("importance_rank", 0), item[0]))
+    top_sections = [dict(section, importance_rank=rank) for rank, (_, section) in enumerate(ranked[:MERGED_TOP_SECTIONS], start=1)]
+    insights = {}
+    for field in ("key_insights", "did_you_know", "cross_document_connections"):
+        insights[field] = previous.get("llm_insights", {}).get(field, []) + delta.get("llm_insights", {}).get(field, [])
+    return {"top_sections": top_sections, "llm_insights": insights}
+
+
+async def merge_analyses(previous: Dict[str, Any], delta: Dict[str, Any], replaced: set, persona: str, job_to_be_done: str) -> Dict[str, Any]:
+    """
+    Folds the analysis of newly added documents into the session's existing one.
+    Only the two analyses are sent (no document text), so this call stays small
+    however many documents the session already holds.
+    """
+    previous_compact = {
+        "top_sections": [s for s in previous.get("top_sections", []) if s.get("document") not in replaced],
+        "llm_insights": previous.get("llm_insights", {}),
+    }
+    prompt = f"""
+    You are an expert research assistant acting as a '{persona}' whose goal is to '{job_to_be_done}'.
+    An existing analysis covers documents the user uploaded earlier. New or updated documents ({', '.join(sorted(replaced))}) were analyzed separately.
+    Merge the two into one analysis:
+    1. Choose and rank the top {MERGED_TOP_SECTIONS} sections from both lists for 'top_sections'. Keep document, page_number, section_title and subsection_analysis exactly as given.
+    2. Merge 'llm_insights', dropping duplicates. In *cross_document_connections*, connect the new documents with the earlier ones.
+       Insights about previous versions of the updated documents have been superseded by the new analysis.
+    *Existing Analysis:*
+    {json.dumps(previous_compact, ensure_ascii=False)}
+    *Analysis of New Documents:*
+    {json.dumps(delta, ensure_ascii=False)}
+    Respond ONLY with a single JSON object that strictly adheres to the specified schema.
+    """
+    payload = {"contents": [{"parts": [{"text": prompt}]}],"generationConfig": {"responseMimeType": "application/json", "responseSchema": ANALYSIS_SCHEMA}}
+    try:
+        response_json = await call_gemini_api(payload, priority=PRIORITY_ANALYSIS)
+        return json.loads(response_json['candidates'][0]['content']['parts'][0]['text'])
+    except Exception as e:
+        logger.error(f"Failed to merge incremental analysis, falling back to a local merge: {e}")
+        return merge_analyses_locally(previous, delta, replaced)
+
+
+async def run_incremental_analysis(documents: List[Dict[str, Any]], previous_analysis: Dict[str, Any], persona: str, job_to_be_done: str) -> Dict[str, Any]:
+    """
+    Re-analyzes a session after documents were added or replaced. Only the new
+    or changed documents go through run_connected_analysis; the result is merged
+    into the existing top_sections and llm_insights. Falls back to a full
+    analysis when the earlier one cannot be extended.
+    """
+    if not can_merge_into(previous_analysis, persona, job_to_be_done):
+        return await run_connected_analysis(documents, persona, job_to_be_done)
+    changed = find_changed_documents(documents, previous_analysis.get("metadata", {}))
+    current_names = {doc["name"] for doc in documents}
+    removed = set(previous_analysis.get("metadata", {}).get("input_documents", [])) - current_names
+    if len(changed) == len(documents):
+        return await run_connected_analysis(documents, persona, job_to_be_done)
+    if not changed:
+        logger.info("No new or changed documents; reusing the existing analysis.")
+        if removed:
+            return merge_analyses_locally(previous_analysis, {}, removed)
+        return {k: v for k, v in previous_analysis.items() if k != "metadata"}
+    logger.info(f"Incremental analysis of {len(changed)} of {len(documents)} documents.")
+    delta = await run_connected_analysis([dict(doc, is_new=True) for doc in changed], persona, job_to_be_done)
+    if not delta.get("top_sections"):
+        # The delta analysis failed; keep the earlier analysis rather than replacing it with an error
+        return merge_analyses_locally(previous_analysis, {}, removed)
+    return await merge_analyses(previous_analysis, delta, {doc["name"] for doc in changed} | removed, persona, job_to_be_done)
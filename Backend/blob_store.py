@@ -0,0 +1,125 @@
+# Backend/blob_store.py
+
+import os
+import re
+import shutil
+import logging
+from typing import Dict, Optional
+from urllib.parse import quote, unquote
+
+from redis_client import get_redis_client
+from extraction_cache import file_sha256
+
+logger = logging.getLogger(__name__)
+
+# --- Blob Store Settings ---
+# Every distinct file is stored once, at blobs/<sha256>, whoever uploaded it and under whatever name
+BLOB_DIR = os.getenv("BLOB_DIR", "blobs")
+BLOB_URL_PREFIX = "/files"
+LEGACY_URL_PREFIX = "/session_files"
+
+# --- Constants for Redis Keys ---
+# user:<email>:files   hash of display name -> sha256 (the user's current library)
+# user:<email>:blobs   set of every sha256 the user has uploaded (keeps older sessions' files readable)
+USER_FILES_SUFFIX = ":files"
+USER_BLOBS_SUFFIX = ":blobs"
+
+_CONTENT_HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def is_content_hash(value: str) -> bool:
+    return bool(_CONTENT_HASH_RE.match(value or ""))
+
+
+def blob_path(content_hash: str) -> str:
+    return os.path.join(BLOB_DIR, content_hash)
+
+
+def blob_url(content_hash: str, filename: str) -> str:
+    """
+    Immutable URL of a file's content. It ends in the percent-encoded display
+    name, which clients decode to label the file and match it to insights.
+    """
+    return f"{BLOB_URL_PREFIX}/{content_hash}/{quote(filename)}"
+
+
+def store_blob(tmp_path: str, content_hash: str) -> str:
+    """
+    Moves a fully written temp file into the store under its content hash. If
+    the same content is already stored the temp file is simply discarded.
+    """
+    os.makedirs(BLOB_DIR, exist_ok=True)
+    final_path = blob_path(content_hash)
+    if os.path.exists(final_path):
+        os.remove(tmp_path)
+        return final_path
+    try:
+        os.replace(tmp_path, final_path)
+    except OSError:
+        # tmp_path on another filesystem: copy next to the target, then rename atomically
+        staging_path = f"{final_path}.{os.getpid()}.partial"
+        shutil.move(tmp_path, staging_path)
+        os.replace(staging_path, final_path)
+    return final_path
+
+
+# --- Per-User Name Mappings ---
+
+def link_user_file(user_id: str, filename: str, content_hash: str):
+    """Points a user's file name at a blob. Re-uploading a name re-points it; the old blob stays for older sessions."""
+    redis = get_redis_client()
+    if not redis:
+        logger.error("❌ Redis client is not available. Failed to link user file.")
+        return
+    with redis.pipeline() as pipe:
+        pipe.hset(f"user:{user_id}{USER_FILES_SUFFIX}", filename, content_hash)
+        pipe.sadd(f"user:{user_id}{USER_BLOBS_SUFFIX}", content_hash)
+        pipe.execute()
+
+
+def get_user_files(user_id: str) -> Dict[str, str]:
+    """The user's current library as {filename: sha256}."""
+    redis = get_redis_client()
+    if not redis:
+        return {}
+    return redis.hgetall(f"user:{user_id}{USER_FILES_SUFFIX}")
+
+
+def user_owns_blob(user_id: str, content_hash: str) -> bool:
+    redis = get_redis_client()
+    if not redis:
+        return False
+    return bool(redis.sismember(f"user:{user_id}{USER_BLOBS_SUFFIX}", content_hash))
+
+
+def import_legacy_files(user_id: str, legacy_dir: str):
+    """
+    Copies files from the old session_files/<email>/<filename> layout into the
+    blob store the first time the user's library is read. The originals are left
+    in place so URLs stored in older sessions keep working.
+    """
+    if not os.path.isdir(legacy_dir):
+        return
+    library = get_user_files(user_id)
+    for filename in os.listdir(legacy_dir):
+        legacy_path = os.path.join(legacy_dir, filename)
+        if filename in library or not os.path.isfile(legacy_path):
+            continue
+        content_hash = file_sha256(legacy_path)
+        os.makedirs(BLOB_DIR, exist_ok=True)
+        if not os.path.exists(blob_path(content_hash)):
+            staging_path = f"{blob_path(content_hash)}.{os.getpid()}.partial"
+            shutil.copyfile(legacy_path, staging_path)
+            os.replace(staging_path, blob_path(content_hash))
+        link_user_file(user_id, filename, content_hash)
+        logger.info(f"Imported legacy file {filename} for {user_id} into the blob store.")
+
+
+def resolve_file_url(url: str, legacy_root: str) -> Optional[str]:
+    """Local path behind a file_path_map URL, for blob URLs and legacy /session_files URLs alike."""
+    if url.startswith(f"{BLOB_URL_PREFIX}/"):
+        content_hash = unquote(url[len(BLOB_URL_PREFIX) + 1:]).split("/", 1)[0]
+        return blob_path(content_hash) if is_content_hash(content_hash) else None
+    if url.startswith(f"{LEGACY_URL_PREFIX}/"):
+        return os.path.join(legacy_root, os.path.relpath(url, LEGACY_URL_PREFIX))
+    return None
@@ -0,0 +1,132 @@
+# Backend/chat_context.py
+
+import os
+import json
+import logging
+from typing import Any, Dict, List
+
+from llm_client import call_gemini_api
+from rate_limiter import PRIORITY_BACKGROUND
+from retrieval import get_or_build_index, rank_pages
+from session_manager import get_session, get_chat_summary, set_chat_summary
+from token_budget import estimate_tokens, truncate_to_tokens, make_segment, pack_segments, prompt_budget
+
+logger = logging.getLogger(__name__)
+
+# --- Token Budgets (estimated tokens) ---
+# Whole prompt; also capped by the configured model's prompt budget
+CHAT_PROMPT_TOKENS = int(os.getenv("CHAT_PROMPT_TOKENS", 16000))
+CHAT_PASSAGE_TOKENS = int(os.getenv("CHAT_PASSAGE_TOKENS", 6000))
+CHAT_PASSAGE_TOP_K = int(os.getenv("CHAT_PASSAGE_TOP_K", 6))
+CHAT_HISTORY_TOKENS = int(os.getenv("CHAT_HISTORY_TOKENS", 3000))
+CHAT_HISTORY_WINDOW = int(os.getenv("CHAT_HISTORY_WINDOW", 10))
+CHAT_ANALYSIS_TOKENS = int(os.getenv("CHAT_ANALYSIS_TOKENS", 2000))
+CHAT_SUMMARY_TOKENS = int(os.getenv("CHAT_SUMMARY_TOKENS", 800))
+# Older turns are folded into the rolling summary in batches of this many messages
+CHAT_SUMMARY_BATCH = int(os.getenv("CHAT_SUMMARY_BATCH", 6))
+
+
+def select_passages(documents: List[Dict[str, Any]], query: str) -> List[str]:
+    """Returns the pages most relevant to the query, formatted with page markers, within CHAT_PASSAGE_TOKENS."""
+    if not documents:
+        return []
+    indexes = [get_or_build_index(doc["pages"]) for doc in documents]
+    passages, used_tokens = [], 0
+    for score, doc_no, page_idx in rank_pages(indexes, query)[:CHAT_PASSAGE_TOP_K]:
+        if score <= 0:
+            break
+        name = documents[doc_no]["name"]
+        remaining = CHAT_PASSAGE_TOKENS - used_tokens
+        if remaining <= 0:
+            break
+        text = truncate_to_tokens(documents[doc_no]["pages"][page_idx], remaining)
+        passages.append(f"--- START OF PAGE {page_idx + 1} in {name} ---\n{text}\n--- END OF PAGE {page_idx + 1} in {name} ---")
+        used_tokens += estimate_tokens(text)
+    return passages
+
+
+def compact_analysis(analysis: Dict[str, Any]) -> str:
+    """The initial analysis without metadata (file paths, timestamps), capped at CHAT_ANALYSIS_TOKENS."""
+    compact = {k: v for k, v in analysis.items() if k != "metadata"}
+    return truncate_to_tokens(json.dumps(compact, ensure_ascii=False), CHAT_ANALYSIS_TOKENS)
+
+
+def recent_window(chat_history: List[Dict[str, str]], covered: int) -> List[Dict[str, str]]:
+    """Most recent turns not yet folded into the summary, newest kept first when trimming to CHAT_HISTORY_TOKENS."""
+    candidates = chat_history[max(covered, len(chat_history) - CHAT_HISTORY_WINDOW):]
+    window, used_tokens = [], 0
+    for message in reversed(candidates):
+        tokens = estimate_tokens(message.get("content", ""))
+        if window and used_tokens + tokens > CHAT_HISTORY_TOKENS:
+            break
+        window.append(message)
+        used_tokens += tokens
+    return list(reversed(window))
+
+
+def build_chat_prompt(session_id: str, session_data: Dict[str, Any], documents: List[Dict[str, Any]], query: str) -> str:
+    """
+    Builds a chat prompt of bounded size from relevant document passages, the
+    compact initial analysis, the rolling summary of older turns and a sliding
+    window of recent turns. The sections are packed by priority into
+    CHAT_PROMPT_TOKENS: instructions and query first, then recent history, the
+    analysis and summary, and finally passages in relevance order.
+    """
+    summary = get_chat_summary(session_id)
+    passages = select_passages(documents, query)
+    history = "\n".join(f"{m.get('role')}: {m.get('content')}" for m in recent_window(session_data["chat_history"], summary["covered"]))
+    segments = [
+        make_segment("You are a helpful assistant. Based on the relevant document passages, the initial analysis context and the conversation history, answer the user's last query. Do not give the results from outside the documents uploaded.", priority=0, trimmable=False),
+        make_segment(f"Initial Analysis: {compact_analysis(session_data['analysis'])}", priority=2),
+    ]
+    segments += [dict(make_segment(passage, priority=3 + rank), passage=True) for rank, passage in enumerate(passages)]
+    if summary["summary"]:
+        segments.append(make_segment(f"Summary of Earlier Conversation: {summary['summary']}", priority=2))
+    segments.append(make_segment(f"Recent History:\n{history}", priority=1))
+    segments.append(make_segment(f"User Query: {query}", priority=0, trimmable=False))
+
+    packed, _ = pack_segments(segments, min(CHAT_PROMPT_TOKENS, prompt_budget()))
+    sections, in_passages = [], False
+    for segment in packed:
+        if segment.get("passage"):
+            if not in_passages:
+                sections.append("Relevant Passages:\n" + segment["text"])
+            else:
+                sections[-1] += "\n" + segment["text"]
+        else:
+            sections.append(segment["text"])
+        in_passages = bool(segment.get("passage"))
+    return "\n\n".join(sections)
+
+
+async def refresh_chat_summary(session_id: str):
+    """
+    Folds turns that have slid out of the recent window into the rolling summary
+    stored in Redis. Runs as a background task after a chat response is sent.
+    """
+    session_data = get_session(session_id)
+    if not session_data:
+        return
+    chat_history = session_data["chat_history"]
+    summary = get_chat_summary(session_id)
+    window_start = len(chat_history) - CHAT_HISTORY_WINDOW
+    if window_start - summary["covered"] < CHAT_SUMMARY_BATCH:
+        return
+    aged_out = chat_history[summary["covered"]:window_start]
+    transcript = "\n".join(f"{m.get('role')}: {m.get('content')}" for m in aged_out)
+    prompt = f"""
+    Update the running summary of a conversation between a user and an assistant about their documents.
+    Keep facts, decisions, open questions and user preferences; drop pleasantries. Stay under {CHAT_SUMMARY_TOKENS * 3 // 4} words.
+    Respond ONLY with the updated summary text.
+    *Current Summary:*
+    {summary['summary'] or '(none)'}
+    *New Turns:*
+    {transcript}
+    """
+    payload = {"contents": [{"parts": [{"text": prompt}]}]}
+    try:
+        response_json = await call_gemini_api(payload, priority=PRIORITY_BACKGROUND)
+        new_summary = response_json['candidates'][0]['content']['parts'][0]['text'].strip()
+        set_chat_summary(session_id, truncate_to_tokens(new_summary, CHAT_SUMMARY_TOKENS), window_start)
+    except Exception as e:
+        logger.warning(f"Could not refresh chat summary for session {session_id}: {e}")
@@ -0,0 +1,60 @@
+# Backend/extraction_cache.py
+
+import os
+import json
+import hashlib
+import logging
+from typing import Any, Dict, Optional
+
+from text_preprocessor import PROMPT_PREPROCESSING_ENABLED, PREPROCESSOR_VERSION
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the extractor output changes so stale entries are ignored
+EXTRACTOR_VERSION = "3"
+# Page texts differ with prompt preprocessing on or off, so every cache/store key includes this
+TEXT_VARIANT = f"pp{PREPROCESSOR_VERSION}" if PROMPT_PREPROCESSING_ENABLED else "raw"
+EXTRACTION_CACHE_DIR = os.getenv("EXTRACTION_CACHE_DIR", "extraction_cache")
+# Outline extraction profile (fast | balanced | accurate) used when a request does not choose one
+PDF_EXTRACTION_PROFILE = os.getenv("PDF_EXTRACTION_PROFILE", "balanced")
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(file_path: str) -> str:
+    """SHA-256 of a file's contents, read in fixed-size chunks."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _cache_path(content_hash: str, profile: str) -> str:
+    return os.path.join(EXTRACTION_CACHE_DIR, f"{content_hash}-v{EXTRACTOR_VERSION}-{TEXT_VARIANT}-{profile}.json")
+
+
+def load_cached_extraction(content_hash: str, profile: str = PDF_EXTRACTION_PROFILE) -> Optional[Dict[str, Any]]:
+    """Returns the cached {pages, page_count, title, outline, sections, text_stats} record for a document, if any."""
+    try:
+        with open(_cache_path(content_hash, profile), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable extraction cache entry {content_hash}: {e}")
+        return None
+
+
+def store_extraction(content_hash: str, record: Dict[str, Any], profile: str = PDF_EXTRACTION_PROFILE):
+    """Writes an extraction record atomically so concurrent workers never see a partial file."""
+    os.makedirs(EXTRACTION_CACHE_DIR, exist_ok=True)
+    path = _cache_path(content_hash, profile)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(record, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Could not write extraction cache entry {content_hash}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -0,0 +1,215 @@
+# Backend/jobs.py
+
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+# --- Constants for Redis Keys ---
+JOB_PREFIX = "job:"
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", 24 * 3600))
+# job_worker:<worker_id> exists while the process owning a job's queue is alive
+WORKER_HEARTBEAT_PREFIX = "job_worker:"
+WORKER_HEARTBEAT_INTERVAL = float(os.getenv("JOB_WORKER_HEARTBEAT_INTERVAL", 10.0))
+WORKER_HEARTBEAT_TTL = int(WORKER_HEARTBEAT_INTERVAL * 3)
+# How often the /events SSE stream re-reads a job
+JOB_EVENTS_POLL_INTERVAL = float(os.getenv("JOB_EVENTS_POLL_INTERVAL", 0.5))
+
+# --- Worker Settings ---
+# Analysis concurrency is sized independently of the number of web requests in flight
+ANALYSIS_JOB_WORKERS = int(os.getenv("ANALYSIS_JOB_WORKERS", 2))
+
+# --- Job Status & Stages ---
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+JOB_FINISHED_STATUSES = (JOB_COMPLETED, JOB_FAILED)
+
+STAGE_UPLOADED = "uploaded"
+STAGE_EXTRACTING = "extracting"
+STAGE_LLM_RUNNING = "llm_running"
+STAGE_STORING = "storing"
+STAGE_DONE = "done"
+
+_JSON_FIELDS = ("progress", "result", "params")
+
+
+# --- Job State (stored in Redis so any web worker can report it) ---
+
+def create_job(user_id: str, params: Dict[str, Any], worker_id: str = "") -> Optional[str]:
+    """Records a queued job owned by the queue `worker_id` (see JobQueue.worker_id)."""
+    redis = get_redis_client()
+    if not redis:
+        logger.error("❌ Redis client is not available. Failed to create job.")
+        return None
+    job_id = str(uuid.uuid4())
+    job_key = f"{JOB_PREFIX}{job_id}"
+    now = time.strftime("%Y-%m-%dT%H:%M:%S")
+    with redis.pipeline() as pipe:
+        pipe.hset(job_key, mapping={
+            "id": job_id,
+            "user_id": user_id,
+            "status": JOB_QUEUED,
+            "stage": STAGE_UPLOADED,
+            "progress": json.dumps({}),
+            "params": json.dumps(params),
+            "worker_id": worker_id,
+            "created_at": now,
+            "updated_at": now,
+            "version": 0,
+        })
+        pipe.expire(job_key, JOB_TTL_SECONDS)
+        pipe.execute()
+    return job_id
+
+
+def update_job(job_id: str, **fields):
+    redis = get_redis_client()
+    if not redis:
+        return
+    job_key = f"{JOB_PREFIX}{job_id}"
+    mapping = {k: json.dumps(v) if k in _JSON_FIELDS else v for k, v in fields.items()}
+    mapping["updated_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    with redis.pipeline() as pipe:
+        pipe.hset(job_key, mapping=mapping)
+        pipe.hincrby(job_key, "version", 1)
+        pipe.expire(job_key, JOB_TTL_SECONDS)
+        pipe.execute()
+
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    redis = get_redis_client()
+    if not redis:
+        return None
+    data = redis.hgetall(f"{JOB_PREFIX}{job_id}")
+    if not data:
+        return None
+    for field in _JSON_FIELDS:
+        if field in data:
+            data[field] = json.loads(data[field])
+    data["version"] = int(data.get("version", 0))
+    return data
+
+
+def is_worker_alive(worker_id: str) -> bool:
+    redis = get_redis_client()
+    if not redis:
+        return True
+    return bool(worker_id) and bool(redis.exists(f"{WORKER_HEARTBEAT_PREFIX}{worker_id}"))
+
+
+def reap_if_orphaned(job: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Marks an unfinished job as failed when the process whose queue held it is
+    gone (restart, --reload, crash); its in-memory queue died with it, so the
+    job would otherwise stay queued/running until its TTL. Returns the current job.
+    """
+    if job["status"] in JOB_FINISHED_STATUSES or is_worker_alive(job.get("worker_id", "")):
+        return job
+    logger.warning(f"Analysis job {job['id']} was orphaned by a server restart; marking it failed.")
+    update_job(job["id"], status=JOB_FAILED, error="The server restarted before this analysis finished. Please resubmit.")
+    return get_job(job["id"]) or job
+
+
+def reap_orphaned_jobs() -> int:
+    """Fails every unfinished job whose owning worker is no longer alive. Returns how many were failed."""
+    redis = get_redis_client()
+    if not redis:
+        return 0
+    reaped = 0
+    for job_key in redis.scan_iter(match=f"{JOB_PREFIX}*"):
+        job = get_job(job_key[len(JOB_PREFIX):])
+        if job and job.get("status") not in JOB_FINISHED_STATUSES:
+            reaped += reap_if_orphaned(job)["status"] == JOB_FAILED
+    return reaped
+
+
+# --- Background Workers ---
+
+JobHandler = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
+
+class JobQueue:
+    """
+    In-process queue drained by a fixed number of asyncio workers. Each job's
+    handler reports stage-level progress through update_job; failures are
+    recorded on the job instead of propagating.
+    """
+
+    def __init__(self, workers: int = ANALYSIS_JOB_WORKERS):
+        self.workers = workers
+        # Identifies this process's queue on the jobs it owns; see reap_if_orphaned
+        self.worker_id = str(uuid.uuid4())
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._handler: Optional[JobHandler] = None
+
+    def start(self, handler: JobHandler):
+        self._handler = handler
+        self._queue = asyncio.Queue()
+        self._beat()
+        self._tasks = [asyncio.create_task(self._worker(n)) for n in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._heartbeat()))
+        reaped = reap_orphaned_jobs()
+        if reaped:
+            logger.warning(f"Marked {reaped} analysis jobs from a previous run as failed.")
+        logger.info(f"✅ Started {self.workers} analysis job workers.")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        redis = get_redis_client()
+        if redis:
+            # Jobs still queued here are lost with the process; let readers see that right away
+            redis.delete(f"{WORKER_HEARTBEAT_PREFIX}{self.worker_id}")
+
+    def _beat(self):
+        redis = get_redis_client()
+        if redis:
+            redis.set(f"{WORKER_HEARTBEAT_PREFIX}{self.worker_id}", time.strftime("%Y-%m-%dT%H:%M:%S"), ex=WORKER_HEARTBEAT_TTL)
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(WORKER_HEARTBEAT_INTERVAL)
+            try:
+                self._beat()
+            except Exception as e:
+                logger.warning(f"Job worker heartbeat failed: {e}")
+
+    def submit(self, job_id: str, params: Dict[str, Any]):
+        if self._queue is None:
+            raise RuntimeError("Job queue has not been started.")
+        self._queue.put_nowait((job_id, params))
+
+    async def _worker(self, worker_no: int):
+        while True:
+            job_id, params = await self._queue.get()
+            try:
+                update_job(job_id, status=JOB_RUNNING)
+                await self._handler(job_id, params)
+            except Exception as e:
+                logger.error(f"Analysis job {job_id} failed: {e}")
+                update_job(job_id, status=JOB_FAILED, error=str(getattr(e, "detail", e)))
+            finally:
+                self._queue.task_done()
+
+
+# This variable will hold the single job queue instance
+job_queue: Optional[JobQueue] = None
+
+
+def get_job_queue() -> JobQueue:
+    global job_queue
+    if job_queue is None:
+        job_queue = JobQueue()
+    return job_queue
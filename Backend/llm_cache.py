@@ -0,0 +1,172 @@
+# Backend/llm_cache.py
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import redis as redis_lib
+
+from redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+# --- Constants for Redis Keys ---
+LLM_CACHE_PREFIX = "llmcache:entry:"
+LLM_CACHE_INDEX_KEY = "llmcache:index"   # sorted set: cache key -> last write time
+LLM_CACHE_SIZES_KEY = "llmcache:sizes"   # hash: cache key -> stored bytes
+LLM_CACHE_BYTES_KEY = "llmcache:bytes"   # counter: total stored bytes
+
+# --- Cache Settings ---
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+LLM_CACHE_LRU_MAX_ENTRIES = int(os.getenv("LLM_CACHE_LRU_MAX_ENTRIES", 256))
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+LLM_CACHE_REDIS_MAX_BYTES = int(os.getenv("LLM_CACHE_REDIS_MAX_BYTES", 256 * 1024 * 1024))
+LLM_CACHE_EVICTION_BATCH = 32
+
+
+def make_cache_key(model: str, payload: Dict[str, Any]) -> str:
+    """
+    Content-addressed key: SHA-256 of the model name plus the canonical JSON of
+    the payload (prompt, generationConfig, responseSchema, ...).
+    """
+    canonical = json.dumps({"model": model, "payload": payload}, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    Two-tier cache for Gemini responses: a small in-process LRU in front of a
+    shared Redis tier with a TTL and a total-size cap (oldest entries evicted first).
+    """
+
+    def __init__(self, lru_max_entries: int = LLM_CACHE_LRU_MAX_ENTRIES,
+                 ttl_seconds: int = LLM_CACHE_TTL_SECONDS,
+                 redis_max_bytes: int = LLM_CACHE_REDIS_MAX_BYTES):
+        self.lru_max_entries = lru_max_entries
+        self.ttl_seconds = ttl_seconds
+        self.redis_max_bytes = redis_max_bytes
+        self._lru: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"lru_hits": 0, "redis_hits": 0, "misses": 0, "bypassed": 0, "stores": 0, "evictions": 0}
+
+    # --- In-process LRU tier ---
+    def _lru_get(self, key: str) -> Optional[str]:
+        with self._lock:
+            value = self._lru.get(key)
+            if value is not None:
+                self._lru.move_to_end(key)
+            return value
+
+    def _lru_set(self, key: str, value: str):
+        with self._lock:
+            self._lru[key] = value
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.lru_max_entries:
+                self._lru.popitem(last=False)
+
+    # --- Redis tier ---
+    def _redis_get(self, key: str) -> Optional[str]:
+        redis = get_redis_client()
+        if not redis:
+            return None
+        try:
+            return redis.get(f"{LLM_CACHE_PREFIX}{key}")
+        except redis_lib.exceptions.RedisError as e:
+            logger.warning(f"LLM cache read failed: {e}")
+            return None
+
+    def _redis_set(self, key: str, value: str):
+        redis = get_redis_client()
+        if not redis:
+            return
+        size = len(value.encode("utf-8"))
+        try:
+            with redis.pipeline() as pipe:
+                pipe.set(f"{LLM_CACHE_PREFIX}{key}", value, ex=self.ttl_seconds)
+                pipe.hget(LLM_CACHE_SIZES_KEY, key)
+                pipe.hset(LLM_CACHE_SIZES_KEY, key, size)
+                pipe.zadd(LLM_CACHE_INDEX_KEY, {key: time.time()})
+                pipe.incrby(LLM_CACHE_BYTES_KEY, size)
+                results = pipe.execute()
+            previous_size = results[1]
+            total_bytes = results[4]
+            if previous_size:
+                total_bytes = redis.decrby(LLM_CACHE_BYTES_KEY, int(previous_size))
+            if total_bytes > self.redis_max_bytes:
+                self._evict(redis, total_bytes)
+        except redis_lib.exceptions.RedisError as e:
+            logger.warning(f"LLM cache write failed: {e}")
+
+    def _evict(self, redis, total_bytes: int):
+        """Drops the oldest entries until the Redis tier is back under its size cap."""
+        while total_bytes > self.redis_max_bytes:
+            oldest = redis.zrange(LLM_CACHE_INDEX_KEY, 0, LLM_CACHE_EVICTION_BATCH - 1)
+            if not oldest:
+                redis.set(LLM_CACHE_BYTES_KEY, 0)
+                return
+            sizes = redis.hmget(LLM_CACHE_SIZES_KEY, oldest)
+            freed = sum(int(s) for s in sizes if s)
+            with redis.pipeline() as pipe:
+                pipe.delete(*[f"{LLM_CACHE_PREFIX}{k}" for k in oldest])
+                pipe.zrem(LLM_CACHE_INDEX_KEY, *oldest)
+                pipe.hdel(LLM_CACHE_SIZES_KEY, *oldest)
+                pipe.decrby(LLM_CACHE_BYTES_KEY, freed)
+                total_bytes = pipe.execute()[-1]
+            self.stats["evictions"] += len(oldest)
+            logger.info(f"LLM cache evicted {len(oldest)} entries ({freed} bytes).")
+
+    # --- Public API ---
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self._lru_get(key)
+        if value is not None:
+            self.stats["lru_hits"] += 1
+            return json.loads(value)
+        value = self._redis_get(key)
+        if value is not None:
+            self.stats["redis_hits"] += 1
+            self._lru_set(key, value)
+            return json.loads(value)
+        self.stats["misses"] += 1
+        return None
+
+    def set(self, key: str, response: Dict[str, Any]):
+        value = json.dumps(response, ensure_ascii=False)
+        self._lru_set(key, value)
+        self._redis_set(key, value)
+        self.stats["stores"] += 1
+
+    def record_bypass(self):
+        self.stats["bypassed"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        hits = self.stats["lru_hits"] + self.stats["redis_hits"]
+        lookups = hits + self.stats["misses"]
+        redis = get_redis_client()
+        redis_bytes = None
+        if redis:
+            try:
+                redis_bytes = int(redis.get(LLM_CACHE_BYTES_KEY) or 0)
+            except redis_lib.exceptions.RedisError:
+                pass
+        return {
+            **self.stats,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "lru_entries": len(self._lru),
+            "redis_bytes": redis_bytes,
+        }
+
+
+# This variable will hold the single cache instance
+llm_cache: Optional[LLMResponseCache] = None
+
+
+def get_llm_cache() -> LLMResponseCache:
+    global llm_cache
+    if llm_cache is None:
+        llm_cache = LLMResponseCache()
+    return llm_cache
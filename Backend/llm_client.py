@@ -0,0 +1,235 @@
+# Backend/llm_client.py
+
+import os
+import json
+import asyncio
+import logging
+from typing import AsyncIterator, Optional
+
+import httpx
+from fastapi import HTTPException
+
+from token_provider import get_token_provider
+from llm_cache import get_llm_cache, make_cache_key, LLM_CACHE_ENABLED
+from rate_limiter import (
+    get_rate_limiter,
+    parse_retry_after,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_ANALYSIS
+)
+from single_flight import SingleFlight
+from token_budget import get_token_estimator, current_model, model_input_limit, payload_text_chars
+
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+GEMINI_API_BASE_URL = "https://generativelanguage.googleapis.com/v1beta/models"
+
+# --- Connection Pool Settings ---
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "true").lower() in ("1", "true", "yes")
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", 20))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", 10))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", 60.0))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", 10.0))
+
+# This variable will hold the single app-scoped HTTP client instance
+http_client: Optional[httpx.AsyncClient] = None
+
+# Coalesces identical in-flight generateContent requests
+gemini_flight = SingleFlight("gemini")
+
+
+def _build_http_client() -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(120.0, connect=LLM_CONNECT_TIMEOUT)
+    return httpx.AsyncClient(http2=LLM_HTTP2, limits=limits, timeout=timeout)
+
+
+async def init_http_client() -> httpx.AsyncClient:
+    """Creates the pooled HTTP client. Called once from the app startup event."""
+    global http_client
+    if http_client is None or http_client.is_closed:
+        http_client = _build_http_client()
+        logger.info(
+            f"✅ LLM HTTP client ready (http2={LLM_HTTP2}, max_connections={LLM_MAX_CONNECTIONS}, "
+            f"keepalive={LLM_MAX_KEEPALIVE_CONNECTIONS})"
+        )
+    return http_client
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Returns the shared pooled HTTP client, creating it lazily if the startup
+    event has not run (e.g. when used from a script).
+    """
+    global http_client
+    if http_client is None or http_client.is_closed:
+        http_client = _build_http_client()
+    return http_client
+
+
+async def close_http_client():
+    """Closes the pooled HTTP client. Called once from the app shutdown event."""
+    global http_client
+    if http_client is not None:
+        await http_client.aclose()
+        http_client = None
+        logger.info("✅ LLM HTTP client closed.")
+
+
+async def _build_request(model: str, method: str = "generateContent"):
+    api_key = os.environ.get("GOOGLE_API_KEY")
+    if api_key:
+        api_url = f"{GEMINI_API_BASE_URL}/{model}:{method}?key={api_key}"
+        headers = {"Content-Type": "application/json"}
+    else:
+        # Fallback to service account credentials if API key is not present
+        token = await get_token_provider().get_token()
+        api_url = f"{GEMINI_API_BASE_URL}/{model}:{method}"
+        headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+    return api_url, headers
+
+
+# ==============================================================================
+# Centralized Gemini API Caller
+# ==============================================================================
+async def call_gemini_api(payload: dict, timeout: float = 120.0, use_cache: bool = True,
+                          priority: int = PRIORITY_ANALYSIS) -> dict:
+    """
+    Sends a generateContent request to Gemini. Responses are served from the
+    two-tier response cache unless `use_cache` is False (for endpoints that
+    need fresh output). Requests go through the process-wide rate limiter,
+    which releases them in `priority` order. Identical concurrent requests are
+    coalesced into a single upstream call.
+    """
+    model = current_model()
+    check_prompt_size(model, payload)
+    cache = get_llm_cache()
+    cache_key = make_cache_key(model, payload)
+    use_cache = use_cache and LLM_CACHE_ENABLED
+    if use_cache:
+        cached_response = cache.get(cache_key)
+        if cached_response is not None:
+            return cached_response
+    else:
+        cache.record_bypass()
+
+    async def send_and_store():
+        response_json = await _send_gemini_request(model, payload, timeout, priority)
+        if use_cache and response_json.get("candidates"):
+            cache.set(cache_key, response_json)
+        return response_json
+
+    return await gemini_flight.do(cache_key, send_and_store)
+
+
+def check_prompt_size(model: str, payload: dict):
+    """Rejects prompts that cannot fit the model window before paying for a round trip that would fail."""
+    estimated = get_token_estimator().estimate_payload(payload, model)
+    if estimated > model_input_limit(model):
+        raise HTTPException(status_code=413, detail=f"Prompt of ~{estimated} tokens exceeds the {model} input limit.")
+
+
+def record_prompt_usage(model: str, payload: dict, usage: dict):
+    """Feeds the real prompt token count back into the estimator."""
+    estimator = get_token_estimator()
+    estimator.record(model, payload_text_chars(payload), estimator.estimate_payload(payload, model), usage.get("promptTokenCount"))
+
+
+GEMINI_MAX_RETRIES = 5
+
+
+async def _start_attempt(model: str, priority: int, estimated_tokens: int, method: str = "generateContent"):
+    # A 429/503 seen by any caller delays this acquire via the shared backoff
+    await get_rate_limiter().acquire(priority, estimated_tokens)
+    return await _build_request(model, method)
+
+
+async def _retry_or_raise(error: Exception, attempt: int, label: str = "Gemini"):
+    """
+    Shared handling of a failed Gemini attempt: returns when the caller may
+    retry (429/503 after the shared backoff, transport errors after a pause),
+    raises an HTTPException when the error is final.
+    """
+    if isinstance(error, httpx.HTTPStatusError):
+        status_code = error.response.status_code
+        if status_code in (429, 503):
+            wait_time = get_rate_limiter().report_throttled(parse_retry_after(error.response.headers))
+            logger.warning(f"{label} error {status_code}. All callers backing off for {wait_time:.2f}s...")
+            return
+        raise HTTPException(status_code=status_code, detail=f"Gemini API error: {error}")
+    if attempt < GEMINI_MAX_RETRIES - 1:
+        await asyncio.sleep(1)
+        return
+    raise HTTPException(status_code=504, detail=f"Gemini request failed: {error}")
+
+
+async def _send_gemini_request(model: str, payload: dict, timeout: float, priority: int) -> dict:
+    client = get_http_client()
+    limiter = get_rate_limiter()
+    # Charged against the tokens/min bucket; reconciled with the real count afterwards
+    estimated_tokens = get_token_estimator().estimate_payload(payload, model)
+
+    for attempt in range(GEMINI_MAX_RETRIES):
+        api_url, headers = await _start_attempt(model, priority, estimated_tokens)
+        try:
+            response = await client.post(api_url, headers=headers, json=payload, timeout=timeout)
+            response.raise_for_status()
+            limiter.report_success()
+            response_json = response.json()
+            usage = response_json.get("usageMetadata", {})
+            limiter.reconcile(estimated_tokens, usage.get("totalTokenCount"))
+            record_prompt_usage(model, payload, usage)
+            return response_json
+        except (httpx.HTTPStatusError, httpx.RequestError) as e:
+            await _retry_or_raise(e, attempt)
+    raise HTTPException(status_code=503, detail="Gemini API unavailable after retries.")
+
+
+async def stream_gemini_api(payload: dict, timeout: float = 120.0,
+                            priority: int = PRIORITY_INTERACTIVE) -> AsyncIterator[str]:
+    """
+    Calls Gemini's streamGenerateContent endpoint and yields text deltas as
+    they arrive. Retries on 429/503 or transport errors only until the first
+    chunk is received; a failure after that raises, since a retry would
+    repeat text the caller already has.
+    """
+    model = current_model()
+    check_prompt_size(model, payload)
+    client = get_http_client()
+    limiter = get_rate_limiter()
+    estimated_tokens = get_token_estimator().estimate_payload(payload, model)
+
+    yielded = False
+    for attempt in range(GEMINI_MAX_RETRIES):
+        api_url, headers = await _start_attempt(model, priority, estimated_tokens, method="streamGenerateContent")
+        try:
+            async with client.stream("POST", api_url, headers=headers, params={"alt": "sse"},
+                                     json=payload, timeout=timeout) as response:
+                if response.status_code >= 400:
+                    await response.aread()
+                    response.raise_for_status()
+                limiter.report_success()
+                usage = {}
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    chunk = json.loads(line[len("data:"):].strip())
+                    usage = chunk.get("usageMetadata", usage)
+                    for candidate in chunk.get("candidates", [])[:1]:
+                        for part in candidate.get("content", {}).get("parts", []):
+                            if part.get("text"):
+                                yielded = True
+                                yield part["text"]
+                limiter.reconcile(estimated_tokens, usage.get("totalTokenCount"))
+                record_prompt_usage(model, payload, usage)
+                return
+        except (httpx.HTTPStatusError, httpx.RequestError) as e:
+            if yielded:
+                raise HTTPException(status_code=502, detail=f"Gemini stream interrupted: {e}")
+            await _retry_or_raise(e, attempt, label="Gemini stream")
+    raise HTTPException(status_code=503, detail="Gemini API unavailable after retries.")
@@ -732,27 +732,60 @@ import os
 import json
 import time
 import shutil
-import fitz
 import uuid
 import asyncio
-import random
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from fastapi.staticfiles import StaticFiles
-import httpx
 from dotenv import load_dotenv
 from pydantic import BaseModel
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException, BackgroundTasks, Depends, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 import logging
-import google.auth
-import google.auth.transport.requests
 
 # --- Load Environment Variables ---
 load_dotenv()
 
 # --- Local Imports ---
 from redis_client import get_redis_client
+from llm_client import call_gemini_api, stream_gemini_api, init_http_client, close_http_client
+from token_provider import get_token_provider
+from llm_cache import get_llm_cache
+from rate_limiter import get_rate_limiter, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+from single_flight import single_flight, make_flight_key
+from translator import SUPPORTED_LANGUAGES, translate_text_gemini, translate_dict_of_lists
+from analysis_engine import run_connected_analysis, run_incremental_analysis, INCREMENTAL_ANALYSIS_ENABLED
+from chat_context import build_chat_prompt, refresh_chat_summary
+from pdf_extraction import init_extraction_pool, close_extraction_pool, extract_many
+from scripts.round1a_main import EXTRACTION_PROFILES
+from page_store import open_page_store
+from token_budget import get_token_estimator, make_segment, pack_segments, prompt_budget
+from uploads import UploadBudget, save_upload, safe_filename
+from blob_store import (
+    blob_path,
+    blob_url,
+    is_content_hash,
+    link_user_file,
+    get_user_files,
+    user_owns_blob,
+    import_legacy_files,
+    resolve_file_url
+)
+from jobs import (
+    create_job,
+    get_job,
+    update_job,
+    get_job_queue,
+    reap_if_orphaned,
+    JOB_EVENTS_POLL_INTERVAL,
+    JOB_QUEUED,
+    JOB_COMPLETED,
+    JOB_FINISHED_STATUSES,
+    STAGE_EXTRACTING,
+    STAGE_LLM_RUNNING,
+    STAGE_STORING,
+    STAGE_DONE
+)
 from session_manager import (
     create_session,
     get_session,
@@ -816,18 +849,29 @@ app.add_middleware(
 )
 
 # --- Global Variables & Constants ---
-SUPPORTED_LANGUAGES = { "en": "English", "hi": "Hindi" }
 AZURE_VOICE_MAP = { "en": "en-US-JennyNeural", "hi": "hi-IN-SwaraNeural" }
 GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY")
+PODCAST_CONTEXT_TOKENS = int(os.getenv("PODCAST_CONTEXT_TOKENS", 6000))
 
 # --- App Startup Event ---
 @app.on_event("startup")
 async def startup_event():
     get_redis_client()
+    await init_http_client()
+    await asyncio.to_thread(init_extraction_pool)
+    get_job_queue().start(run_analysis_job)
     if not GOOGLE_API_KEY:
         print("CRITICAL WARNING: GOOGLE_API_KEY environment variable is not set!")
+        await get_token_provider().warm_up()
     print("Application startup complete.")
 
+# --- App Shutdown Event ---
+@app.on_event("shutdown")
+async def shutdown_event():
+    await get_job_queue().stop()
+    await close_http_client()
+    close_extraction_pool()
+
 # ==============================================================================
 # Authentication Dependency
 # ==============================================================================
@@ -840,105 +884,6 @@ async def get_current_user(authorization: str = Header(...)):
         raise HTTPException(status_code=401, detail="Invalid authentication credentials")
     return user
 
-# ==============================================================================
-# Centralized Gemini API Caller
-# ==============================================================================
-async def call_gemini_api(payload: dict, timeout: float = 120.0) -> dict:
-    model = os.environ.get("GEMINI_MODEL", "gemini-1.5-flash")
-    api_key = os.environ.get("GOOGLE_API_KEY")
-
-    if api_key:
-        api_url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent?key={api_key}"
-        headers = {"Content-Type": "application/json"}
-    else:
-        # Fallback to service account credentials if API key is not present
-        creds, _ = google.auth.load_credentials_from_file(
-            os.environ.get("GOOGLE_APPLICATION_CREDENTIALS"),
-            scopes=["https://www.googleapis.com/auth/cloud-platform"]
-        )
-        auth_req = google.auth.transport.requests.Request()
-        creds.refresh(auth_req)
-        token = creds.token
-        api_url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent"
-        headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
-
-    max_retries = 5
-    base_wait_time = 1
-    for attempt in range(max_retries):
-        try:
-            async with httpx.AsyncClient(timeout=timeout) as client:
-                response = await client.post(api_url, headers=headers, json=payload)
-                response.raise_for_status()
-                return response.json()
-        except httpx.HTTPStatusError as e:
-            if e.response.status_code in (429, 503):
-                wait_time = (base_wait_time * (2 ** attempt)) + random.uniform(0, 1)
-                logger.warning(f"Gemini error {e.response.status_code}. Retrying in {wait_time:.2f}s...")
-                await asyncio.sleep(wait_time)
-                continue
-            raise HTTPException(status_code=e.response.status_code, detail=f"Gemini API error: {e}")
-        except (httpx.ReadTimeout, httpx.RequestError) as e:
-            if attempt < max_retries - 1:
-                await asyncio.sleep(1)
-                continue
-            raise HTTPException(status_code=504, detail=f"Gemini request failed: {e}")
-    raise HTTPException(status_code=503, detail="Gemini API unavailable after retries.")
-
-# ==============================================================================
-# Core Analysis Function
-# ==============================================================================
-async def generate_connected_analysis(full_text_context: str, persona: str, job_to_be_done: str) -> Dict[str, Any]:
-    json_schema = {
-        "type": "OBJECT",
-        "properties": {
-            "top_sections": {
-                "type": "ARRAY",
-                "items": {
-                    "type": "OBJECT",
-                    "properties": {
-                        "importance_rank": {"type": "INTEGER"},
-                        "document": {"type": "STRING"},
-                        "page_number": {"type": "INTEGER"},
-                        "section_title": {"type": "STRING"},
-                        "subsection_analysis": {"type": "STRING", "description": "A relevant snippet from the section."},
-                        "reasoning": {"type": "STRING"}
-                    }, "required": ["importance_rank", "document", "page_number", "section_title", "subsection_analysis", "reasoning"]
-                }
-            },
-            "llm_insights": {
-                "type": "OBJECT",
-                "properties": {
-                    "key_insights": {"type": "ARRAY", "items": {"type": "STRING"}},
-                    "did_you_know": {"type": "ARRAY", "items": {"type": "STRING"}},
-                    "cross_document_connections": {"type": "ARRAY", "items": {"type": "STRING"}}
-                }, "required": ["key_insights", "did_you_know", "cross_document_connections"]
-            }
-        }, "required": ["top_sections", "llm_insights"]
-    }
-    prompt = f"""
-    You are an expert research assistant acting as a '{persona}' whose goal is to '{job_to_be_done}'.
-    Analyze the provided context, which contains the full text from one or more documents.
-    *Your Reasoning Process:*
-    1. *Assess Relevance:* First, review the user's goal: '{job_to_be_done}'. Now, read through all the provided document texts. Decide which documents are relevant to this goal and which are not.
-    2. *Extract Initial Insights:* From the documents you identified as RELEVANT, extract the top 5 most important sections that directly address the user's goal. These will populate the 'top_sections' of the JSON response.Also , for each section, provide:subsections as it is from the pdf. When you extract a section, also include the page number.
-The page number is indicated in the provided context between markers like:
---- START OF PAGE 3 in MyDoc.pdf --- ... --- END OF PAGE 3 in MyDoc.pdf ---.
-Always copy this page number into the "page_number" field in the JSON..
-    3. *Synthesize Connected Insights:* Now, consider all the RELEVANT documents together. Generate the deeper insights for the 'llm_insights' section.
-        - *cross_document_connections*: This is the most critical part. Find connections, patterns, or contradictions between all the relevant materials. Explicitly state which documents you used and which you ignored (and why). For example: "I have ignored Lunch.pdf as it was not relevant to the goal of creating a dinner menu."
-    *Provided Context:*
-    {full_text_context}
-    *Instructions:*
-    Respond ONLY with a single JSON object that strictly adheres to the specified schema. Your response must be based on fulfilling the user's goal using only the relevant documents from the context.
-    """
-    payload = {"contents": [{"parts": [{"text": prompt}]}],"generationConfig": {"responseMimeType": "application/json", "responseSchema": json_schema}}
-    try:
-        response_json = await call_gemini_api(payload)
-        return json.loads(response_json['candidates'][0]['content']['parts'][0]['text'])
-    except Exception as e:
-        logger.error(f"Failed to generate connected analysis: {e}")
-        return {"top_sections": [],"llm_insights": {"key_insights": [f"Error during analysis: {e}"],"did_you_know": [],"cross_document_connections": ["Could not establish connections due to an error."]}}
-
 # ==============================================================================
 # API Endpoints
 # ==============================================================================
@@ -958,49 +903,83 @@ async def login_for_access_token(user: UserLogin):
         raise HTTPException(status_code=401, detail="Incorrect email or password")
     return {"access_token": user.email, "token_type": "bearer", "user_name": authenticated_user['name']}
 
-@app.post("/analyze/")
-async def analyze_documents(files: List[UploadFile] = File(...), persona: str = Form(...), job_to_be_done: str = Form(...), sessionId: str = Form(None), current_user: dict = Depends(get_current_user)):
-    user_email = current_user['email']
-    if not get_redis_client():
-        raise HTTPException(status_code=503, detail="Database service is unavailable.")
-    user_files_dir = os.path.join(SESSION_FILES_DIR, user_email)
-    os.makedirs(user_files_dir, exist_ok=True)
-    context_parts = []
-    processed_filenames = set()
+async def ingest_uploads(files: List[UploadFile], user_email: str):
+    """Streams the uploaded files into the blob store and the user's library. Returns (new_filenames, {filename: sha256})."""
+    new_filenames = []
+    upload_hashes = {}
+    budget = UploadBudget()
     for file in files:
-        if file.filename in processed_filenames:
-            continue
-        try:
-            file_bytes = await file.read()
-            file_location = os.path.join(user_files_dir, file.filename)
-            with open(file_location, "wb+") as file_object:
-                file_object.write(file_bytes)
-            with fitz.open(stream=file_bytes, filetype="pdf") as doc:
-                for page_num, page in enumerate(doc, start=1):
-                    text = page.get_text()
-                    context_parts.append(f"--- START OF PAGE {page_num} in {file.filename} ---\n{text}\n--- END OF PAGE {page_num} in {file.filename} ---\n")
-            processed_filenames.add(file.filename)
-        except Exception as e:
-            logger.error(f"Error reading new file {file.filename}: {e}")
-            raise HTTPException(status_code=400, detail=f"Could not process file: {file.filename}")
-    for existing_filename in os.listdir(user_files_dir):
-        if existing_filename in processed_filenames:
+        filename = safe_filename(file.filename)
+        if filename in new_filenames:
             continue
         try:
-            file_path = os.path.join(user_files_dir, existing_filename)
-            with fitz.open(file_path) as doc:
-                text = "".join(page.get_text() for page in doc)
-                context_parts.append(f"--- START OF FULL TEXT for {existing_filename} ---\n{text}\n--- END OF FULL TEXT for {existing_filename} ---\n")
-                processed_filenames.add(existing_filename)
+            # Stream to disk in chunks, hashing as we go; never hold the whole upload in memory
+            _, sha256, _ = await save_upload(file, budget)
+            link_user_file(user_email, filename, sha256)
+            upload_hashes[filename] = sha256
+            new_filenames.append(filename)
+        except HTTPException:
+            raise
         except Exception as e:
-            logger.error(f"Error reading existing file {existing_filename}: {e}")
+            logger.error(f"Error reading new file {filename}: {e}")
+            raise HTTPException(status_code=400, detail=f"Could not process file: {filename}")
+    return new_filenames, upload_hashes
+
+async def analyze_user_library(user_email: str, new_filenames: List[str], upload_hashes: Dict[str, str], persona: str,
+                               job_to_be_done: str, sessionId: str = None, progress=None, extraction_profile: str = None):
+    """
+    Extracts and analyzes the user's library (new uploads plus existing files) and
+    stores the result in the session. `progress(stage, **info)` is called at each
+    stage for job reporting; `extraction_profile` overrides PDF_EXTRACTION_PROFILE.
+    Returns (session_id, analysis_result).
+    """
+    report = progress or (lambda stage, **info: None)
+    await asyncio.to_thread(import_legacy_files, user_email, os.path.join(SESSION_FILES_DIR, user_email))
+    # The library maps names to content hashes; this request's uploads are pinned to the bytes just received
+    library = {**get_user_files(user_email), **upload_hashes}
+    existing_filenames = [f for f in library if f not in new_filenames]
+    # Parse every file in the process pool so the event loop stays responsive
+    filenames = new_filenames + existing_filenames
+    extraction_progress = {"files_done": 0, "files_total": len(filenames), "pages_extracted": 0}
+    report(STAGE_EXTRACTING, **extraction_progress)
+
+    def on_extracted(path: str, record):
+        extraction_progress["files_done"] += 1
+        if not isinstance(record, Exception):
+            extraction_progress["pages_extracted"] += record["page_count"]
+        report(STAGE_EXTRACTING, **extraction_progress)
+
+    content_hashes = {blob_path(sha256): sha256 for sha256 in library.values()}
+    extracted = await extract_many([blob_path(library[f]) for f in filenames], content_hashes, on_done=on_extracted,
+                                   profile=extraction_profile)
+    documents = []
+    processed_filenames = set()
+    for filename, record in zip(filenames, extracted):
+        is_new = filename in new_filenames
+        if isinstance(record, Exception):
+            if is_new:
+                logger.error(f"Error reading new file {filename}: {record}")
+                raise HTTPException(status_code=400, detail=f"Could not process file: {filename}")
+            logger.error(f"Error reading existing file {filename}: {record}")
             continue
-    if not context_parts:
+        documents.append({"name": filename, "pages": record["pages"], "sha256": record["sha256"], "is_new": is_new,
+                          "title": record.get("title", ""), "sections": record.get("sections", []),
+                          "text_stats": record.get("text_stats", {})})
+        processed_filenames.add(filename)
+    if not documents:
         raise HTTPException(status_code=400, detail="No content available for analysis (new or existing).")
-    full_text_context = "\n".join(context_parts)
-    analysis_result = await generate_connected_analysis(full_text_context, persona, job_to_be_done)
-    file_path_map = {filename: f"/session_files/{user_email}/{filename}" for filename in processed_filenames}
-    analysis_result["metadata"] = {"input_documents": list(processed_filenames),"persona": persona,"job_to_be_done": job_to_be_done,"processing_timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),"file_path_map": file_path_map,"user_id": user_email}
+    report(STAGE_LLM_RUNNING, documents=len(documents))
+    previous_session = get_session(sessionId) if sessionId and INCREMENTAL_ANALYSIS_ENABLED else None
+    if previous_session:
+        # Only new or changed documents are analyzed; the result is merged into the session's analysis
+        analysis_result = await run_incremental_analysis(documents, previous_session["analysis"], persona, job_to_be_done)
+    else:
+        analysis_result = await run_connected_analysis(documents, persona, job_to_be_done)
+    report(STAGE_STORING)
+    file_path_map = {filename: blob_url(library[filename], filename) for filename in processed_filenames}
+    document_hashes = {doc["name"]: doc["sha256"] for doc in documents}
+    text_stats = {doc["name"]: doc["text_stats"] for doc in documents if doc.get("text_stats")}
+    analysis_result["metadata"] = {"input_documents": list(processed_filenames),"persona": persona,"job_to_be_done": job_to_be_done,"processing_timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),"file_path_map": file_path_map,"document_hashes": document_hashes,"text_stats": text_stats,"user_id": user_email}
     if sessionId:
         update_session(sessionId, analysis_result)
         current_session_id = sessionId
@@ -1008,23 +987,179 @@ async def analyze_documents(files: List[UploadFile] = File(...), persona: str =
         current_session_id = create_session(analysis_result, user_email)
         if not current_session_id:
             raise HTTPException(status_code=500, detail="Failed to create a new session.")
+    return current_session_id, analysis_result
+
+def check_extraction_profile(extraction_profile: Optional[str]):
+    if extraction_profile and extraction_profile not in EXTRACTION_PROFILES:
+        raise HTTPException(status_code=400, detail=f"extraction_profile must be one of: {', '.join(EXTRACTION_PROFILES)}.")
+
+@app.post("/analyze/")
+async def analyze_documents(files: List[UploadFile] = File(...), persona: str = Form(...), job_to_be_done: str = Form(...), sessionId: str = Form(None), extraction_profile: str = Form(None), current_user: dict = Depends(get_current_user)):
+    user_email = current_user['email']
+    check_extraction_profile(extraction_profile)
+    if not get_redis_client():
+        raise HTTPException(status_code=503, detail="Database service is unavailable.")
+    new_filenames, upload_hashes = await ingest_uploads(files, user_email)
+    current_session_id, analysis_result = await analyze_user_library(user_email, new_filenames, upload_hashes, persona, job_to_be_done, sessionId,
+                                                                     extraction_profile=extraction_profile)
     return JSONResponse(content={"sessionId": current_session_id, "analysis": analysis_result})
 
-@app.post("/chat/")
-async def chat_with_documents(request: ChatRequest, current_user: dict = Depends(get_current_user)):
+# --- Asynchronous Analysis Jobs ---
+async def run_analysis_job(job_id: str, params: dict):
+    """Job handler executed by the analysis workers; mirrors /analyze/ and records progress on the job."""
+    def progress(stage: str, **info):
+        update_job(job_id, stage=stage, progress=info)
+
+    session_id, analysis_result = await analyze_user_library(
+        params["user_id"], params["new_filenames"], params["upload_hashes"], params["persona"],
+        params["job_to_be_done"], params.get("sessionId"), progress=progress,
+        extraction_profile=params.get("extraction_profile"))
+    update_job(job_id, status=JOB_COMPLETED, stage=STAGE_DONE, result={"sessionId": session_id, "analysis": analysis_result})
+
+def get_owned_job(job_id: str, user_email: str) -> dict:
+    job = get_job(job_id)
+    if not job or job.get("user_id") != user_email:
+        raise HTTPException(status_code=404, detail="Analysis job not found.")
+    return reap_if_orphaned(job)
+
+def job_view(job: dict) -> dict:
+    view = {"jobId": job["id"], "status": job["status"], "stage": job["stage"], "progress": job["progress"],
+            "createdAt": job["created_at"], "updatedAt": job["updated_at"]}
+    if "result" in job:
+        view["result"] = job["result"]
+    if "error" in job:
+        view["error"] = job["error"]
+    return view
+
+@app.post("/analyze/jobs", status_code=202)
+async def create_analysis_job(files: List[UploadFile] = File(...), persona: str = Form(...), job_to_be_done: str = Form(...), sessionId: str = Form(None), extraction_profile: str = Form(None), current_user: dict = Depends(get_current_user)):
+    """
+    Same inputs as /analyze/, but only the upload happens inside the request.
+    Extraction and analysis run on the job workers; follow them with
+    GET /analyze/jobs/{job_id} or the /events SSE stream.
+    """
+    user_email = current_user['email']
+    check_extraction_profile(extraction_profile)
+    if not get_redis_client():
+        raise HTTPException(status_code=503, detail="Database service is unavailable.")
+    new_filenames, upload_hashes = await ingest_uploads(files, user_email)
+    params = {"user_id": user_email, "new_filenames": new_filenames, "upload_hashes": upload_hashes,
+              "persona": persona, "job_to_be_done": job_to_be_done, "sessionId": sessionId,
+              "extraction_profile": extraction_profile}
+    job_id = create_job(user_email, params, worker_id=get_job_queue().worker_id)
+    if not job_id:
+        raise HTTPException(status_code=500, detail="Failed to create an analysis job.")
+    update_job(job_id, progress={"files_uploaded": len(new_filenames)})
+    get_job_queue().submit(job_id, params)
+    return JSONResponse(status_code=202, content={"jobId": job_id, "status": JOB_QUEUED})
+
+@app.get("/analyze/jobs/{job_id}")
+async def get_analysis_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    return JSONResponse(content=job_view(get_owned_job(job_id, current_user['email'])))
+
+@app.get("/analyze/jobs/{job_id}/events")
+async def stream_analysis_job_events(job_id: str, current_user: dict = Depends(get_current_user)):
+    """Server-Sent Events stream of a job's progress; ends with a "completed" or "failed" event."""
+    get_owned_job(job_id, current_user['email'])
+
+    async def event_stream():
+        last_version = -1
+        while True:
+            job = get_job(job_id)
+            if not job:
+                yield format_sse({"detail": "Analysis job expired."}, event="error")
+                return
+            # Stops following a job whose worker died instead of polling it until the TTL
+            job = reap_if_orphaned(job)
+            if job["version"] != last_version:
+                last_version = job["version"]
+                if job["status"] in JOB_FINISHED_STATUSES:
+                    yield format_sse(job_view(job), event=job["status"])
+                    return
+                yield format_sse(job_view(job), event="progress")
+            await asyncio.sleep(JOB_EVENTS_POLL_INTERVAL)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+async def load_session_documents(session_data: dict) -> List[Dict[str, Any]]:
+    """
+    Per-page text for every document attached to a session. Documents with a
+    page store are read from its memory mapping; the rest go through extraction
+    (which also writes their page store for next time).
+    """
+    metadata = session_data['analysis'].get('metadata', {})
+    file_path_map = metadata.get('file_path_map', {})
+    document_hashes = metadata.get('document_hashes', {})
+    documents = {}
+    to_extract = []
+    for filename, url in file_path_map.items():
+        store = open_page_store(document_hashes[filename]) if filename in document_hashes else None
+        if store is not None:
+            documents[filename] = {"name": filename, "pages": store, "sha256": store.content_hash}
+        else:
+            to_extract.append(filename)
+    file_paths = [resolve_file_url(file_path_map[f], SESSION_FILES_DIR) or "" for f in to_extract]
+    for filename, record in zip(to_extract, await extract_many(file_paths)):
+        if isinstance(record, Exception):
+            logger.error(f"Error reading session file {filename}: {record}")
+            continue
+        documents[filename] = {"name": filename, "pages": record["pages"], "sha256": record["sha256"]}
+    return [documents[f] for f in file_path_map if f in documents]
+
+async def build_chat_payload(request: ChatRequest) -> dict:
+    """Records the user's query in the session history and builds a bounded-size chat prompt payload."""
     session_data = get_session(request.sessionId)
     if not session_data:
         raise HTTPException(status_code=404, detail="Chat session not found.")
     add_message_to_history(request.sessionId, {"role": "user", "content": request.query})
     updated_session_data = get_session(request.sessionId)
-    prompt = f"You are a helpful assistant. Based on the initial analysis context and the conversation history, answer the user's last query. Do not give the results from outside the documents uploaded.\n\nContext: {json.dumps(updated_session_data['analysis'])}\n\nHistory: {updated_session_data['chat_history']}\n\nUser Query: {request.query}"
-    payload = {"contents": [{"parts": [{"text": prompt}]}]}
-    response_json = await call_gemini_api(payload)
+    documents = await load_session_documents(updated_session_data)
+    prompt = await asyncio.to_thread(build_chat_prompt, request.sessionId, updated_session_data, documents, request.query)
+    return {"contents": [{"parts": [{"text": prompt}]}]}
+
+def format_sse(data: dict, event: str = None) -> str:
+    message = f"event: {event}\n" if event else ""
+    return message + f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/chat/")
+async def chat_with_documents(request: ChatRequest, background_tasks: BackgroundTasks, current_user: dict = Depends(get_current_user)):
+    payload = await build_chat_payload(request)
+    response_json = await call_gemini_api(payload, use_cache=False, priority=PRIORITY_INTERACTIVE)
     bot_response_content = response_json['candidates'][0]['content']['parts'][0]['text']
     bot_message = {"role": "bot", "content": bot_response_content}
     add_message_to_history(request.sessionId, bot_message)
+    background_tasks.add_task(refresh_chat_summary, request.sessionId)
     return JSONResponse(content=bot_message)
 
+@app.post("/chat/stream")
+async def chat_with_documents_stream(request: ChatRequest, background_tasks: BackgroundTasks, current_user: dict = Depends(get_current_user)):
+    """
+    Streaming variant of /chat/. Forwards Gemini tokens as Server-Sent Events
+    ("delta" messages), then sends a final "done" event with the full bot message
+    once it has been appended to the session history.
+    """
+    payload = await build_chat_payload(request)
+
+    async def event_stream():
+        chunks = []
+        try:
+            async for delta in stream_gemini_api(payload, priority=PRIORITY_INTERACTIVE):
+                chunks.append(delta)
+                yield format_sse({"delta": delta})
+        except Exception as e:
+            logger.error(f"Chat stream failed for session {request.sessionId}: {e}")
+            yield format_sse({"detail": getattr(e, "detail", str(e))}, event="error")
+            if not chunks:
+                return
+        bot_message = {"role": "bot", "content": "".join(chunks)}
+        add_message_to_history(request.sessionId, bot_message)
+        yield format_sse(bot_message, event="done")
+
+    background_tasks.add_task(refresh_chat_summary, request.sessionId)
+    return StreamingResponse(event_stream(), media_type="text/event-stream", background=background_tasks,
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.post("/insights-on-selection")
 async def get_insights_on_selection(request: SelectionInsightsRequest, current_user: dict = Depends(get_current_user)):
     prompt = f"""
@@ -1042,12 +1177,34 @@ async def get_insights_on_selection(request: SelectionInsightsRequest, current_u
     json_schema = {"type": "OBJECT","properties": {"summary": {"type": "STRING"},"key_takeaways": {"type": "ARRAY", "items": {"type": "STRING"}},"potential_questions": {"type": "ARRAY", "items": {"type": "STRING"}}},"required": ["summary", "key_takeaways", "potential_questions"]}
     payload = {"contents": [{"parts": [{"text": prompt}]}],"generationConfig": {"responseMimeType": "application/json", "responseSchema": json_schema}}
     try:
-        response_json = await call_gemini_api(payload)
+        response_json = await call_gemini_api(payload, priority=PRIORITY_INTERACTIVE)
         insights = json.loads(response_json['candidates'][0]['content']['parts'][0]['text'])
         return JSONResponse(content=insights)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate insights: {e}")
 
+@app.get("/llm-cache/stats")
+async def get_llm_cache_stats(current_user: dict = Depends(get_current_user)):
+    return JSONResponse(content=get_llm_cache().get_stats())
+
+@app.get("/llm-rate-limiter/stats")
+async def get_llm_rate_limiter_stats(current_user: dict = Depends(get_current_user)):
+    return JSONResponse(content=get_rate_limiter().get_stats())
+
+@app.get("/llm-token-budget/stats")
+async def get_llm_token_budget_stats(current_user: dict = Depends(get_current_user)):
+    return JSONResponse(content=get_token_estimator().get_stats())
+
+@app.get("/files/{content_hash}/{filename}")
+async def get_session_file(content_hash: str, filename: str, current_user: dict = Depends(get_current_user)):
+    """Serves a stored file by content hash to users who have uploaded that content."""
+    if not is_content_hash(content_hash) or not user_owns_blob(current_user['email'], content_hash):
+        raise HTTPException(status_code=404, detail="File not found.")
+    path = blob_path(content_hash)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="File not found.")
+    return FileResponse(path, media_type="application/pdf")
+
 @app.get("/sessions/")
 async def get_sessions_list(current_user: dict = Depends(get_current_user)):
     user_email = current_user['email']
@@ -1075,32 +1232,30 @@ async def translate_insights_endpoint(request: TranslateInsightsRequest, current
     insights_for_translation = {key: llm_insights.get(key, []) for key in keys_to_translate if llm_insights.get(key)}
     if not insights_for_translation:
         return JSONResponse(content={"message": "No text found in insights to translate."})
-    async def translate_batch_gemini(texts_dict, target_lang):
-        translated_dict = {}
-        for key, texts in texts_dict.items():
-            translated_texts = [await translate_text_gemini(text, target_lang) for text in texts]
-            translated_dict[key] = translated_texts
-        return translated_dict
-    translated_insights = await translate_batch_gemini(insights_for_translation, "hi")
-    if "error" in translated_insights:
-        raise HTTPException(status_code=500, detail=translated_insights["error"])
+    try:
+        translated_insights = await translate_dict_of_lists(insights_for_translation, "hi")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to translate insights: {e}")
     return JSONResponse(content={"translated_insights": translated_insights})
 
+def podcast_flight_key(analysis_data: dict) -> str:
+    metadata = analysis_data.get("metadata", {})
+    return make_flight_key(metadata.get("persona"), metadata.get("job_to_be_done"), analysis_data.get("llm_insights"))
+
+@single_flight("podcast", key_func=podcast_flight_key)
 async def generate_podcast_summary_script(analysis_data: dict) -> str:
     metadata = analysis_data.get("metadata", {})
     llm_insights = analysis_data.get("llm_insights", {})
     if not llm_insights: return "No insights were generated for this analysis."
-    prompt = f"You are a podcast host. Create an engaging, narrative-style podcast script of 400-500 words based on the provided JSON data. The target audience is a '{metadata.get('persona', 'professional')}' who wants to '{metadata.get('job_to_be_done', 'understand key topics')}'. Structure your script with an introduction, a body that weaves the insights into a cohesive story, and a conclusion. Respond ONLY with the text of the podcast script.\n\nData: {json.dumps(llm_insights, indent=2)}"
-    payload = {"contents": [{"parts": [{"text": prompt}]}]}
-    response_json = await call_gemini_api(payload)
-    return response_json['candidates'][0]['content']['parts'][0]['text']
-
-async def translate_text_gemini(text: str, target_language: str) -> str:
-    language_name = SUPPORTED_LANGUAGES.get(target_language)
-    if not language_name: return "Error: Unsupported language."
-    prompt = f"Translate the following text into {language_name}. Provide only the translated text.\n\n---\n\n{text}"
+    # Insights arrive from the client, so pack them into a fixed budget: key insights first
+    insight_fields = ["key_insights", "cross_document_connections", "did_you_know"]
+    segments = [make_segment(json.dumps({field: item}, ensure_ascii=False), priority=rank)
+                for rank, field in enumerate(insight_fields) for item in llm_insights.get(field, [])]
+    packed, _ = pack_segments(segments, min(PODCAST_CONTEXT_TOKENS, prompt_budget()))
+    insights_data = "\n".join(segment["text"] for segment in packed)
+    prompt = f"You are a podcast host. Create an engaging, narrative-style podcast script of 400-500 words based on the provided JSON data. The target audience is a '{metadata.get('persona', 'professional')}' who wants to '{metadata.get('job_to_be_done', 'understand key topics')}'. Structure your script with an introduction, a body that weaves the insights into a cohesive story, and a conclusion. Respond ONLY with the text of the podcast script.\n\nData: {insights_data}"
     payload = {"contents": [{"parts": [{"text": prompt}]}]}
-    response_json = await call_gemini_api(payload)
+    response_json = await call_gemini_api(payload, priority=PRIORITY_BACKGROUND)
     return response_json['candidates'][0]['content']['parts'][0]['text']
 
 @app.post("/generate-podcast/")
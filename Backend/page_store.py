@@ -0,0 +1,126 @@
+# Backend/page_store.py
+
+import os
+import mmap
+import logging
+import threading
+from array import array
+from collections import OrderedDict
+from collections.abc import Sequence
+from typing import List, Optional, Union
+
+from extraction_cache import EXTRACTOR_VERSION, TEXT_VARIANT
+
+logger = logging.getLogger(__name__)
+
+# --- Page Store Settings ---
+# Per document: <hash>-v<ver>-<variant>.txt holds every page's UTF-8 text back to back,
+# <hash>-v<ver>-<variant>.idx holds page_count + 1 uint64 byte offsets into it.
+PAGE_STORE_DIR = os.getenv("PAGE_STORE_DIR", "page_store")
+# Upper bound on documents kept mapped at once
+PAGE_STORE_OPEN_MAX = int(os.getenv("PAGE_STORE_OPEN_MAX", 256))
+
+
+def _store_prefix(content_hash: str) -> str:
+    return os.path.join(PAGE_STORE_DIR, f"{content_hash}-v{EXTRACTOR_VERSION}-{TEXT_VARIANT}")
+
+
+def has_page_store(content_hash: str) -> bool:
+    # The index is written last, so its presence means the store is complete
+    return os.path.exists(f"{_store_prefix(content_hash)}.idx")
+
+
+def write_page_store(content_hash: str, pages: List[str]):
+    """Writes a document's pages and their offset index atomically."""
+    os.makedirs(PAGE_STORE_DIR, exist_ok=True)
+    prefix = _store_prefix(content_hash)
+    suffix = f".{os.getpid()}.tmp"
+    offsets = array("Q", [0])
+    try:
+        with open(f"{prefix}.txt{suffix}", "wb") as f:
+            for text in pages:
+                data = text.encode("utf-8", errors="replace")
+                f.write(data)
+                offsets.append(offsets[-1] + len(data))
+        with open(f"{prefix}.idx{suffix}", "wb") as f:
+            f.write(offsets.tobytes())
+        os.replace(f"{prefix}.txt{suffix}", f"{prefix}.txt")
+        os.replace(f"{prefix}.idx{suffix}", f"{prefix}.idx")
+    except OSError as e:
+        logger.warning(f"Could not write page store for {content_hash}: {e}")
+        for path in (f"{prefix}.txt{suffix}", f"{prefix}.idx{suffix}"):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class PageStore(Sequence):
+    """
+    Read-only, memory-mapped page texts of one document. Pages and page ranges
+    are sliced straight out of the mapping: `page_bytes`/`range_bytes` return
+    zero-copy memoryviews, indexing decodes a single page. Behaves as a sequence
+    of page strings, so it can stand in for an extraction record's `pages`.
+    """
+
+    def __init__(self, content_hash: str):
+        prefix = _store_prefix(content_hash)
+        self.content_hash = content_hash
+        self.fingerprint = f"{content_hash}-v{EXTRACTOR_VERSION}-{TEXT_VARIANT}"
+        self.offsets = array("Q")
+        with open(f"{prefix}.idx", "rb") as f:
+            self.offsets.frombytes(f.read())
+        with open(f"{prefix}.txt", "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            # mmap cannot map an empty file (a PDF with no text)
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self._view = memoryview(self._map)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def page_bytes(self, page_idx: int) -> memoryview:
+        if not 0 <= page_idx < len(self):
+            raise IndexError(page_idx)
+        return self._view[self.offsets[page_idx]:self.offsets[page_idx + 1]]
+
+    def range_bytes(self, start: int, end: int) -> memoryview:
+        """UTF-8 bytes of pages [start, end) as one contiguous view."""
+        start, end = max(0, start), min(len(self), end)
+        if start >= end:
+            return self._view[0:0]
+        return self._view[self.offsets[start]:self.offsets[end]]
+
+    def text(self, start: int, end: int) -> str:
+        return str(self.range_bytes(start, end), "utf-8")
+
+    def __getitem__(self, key: Union[int, slice]):
+        if isinstance(key, slice):
+            return [self[i] for i in range(*key.indices(len(self)))]
+        if key < 0:
+            key += len(self)
+        return str(self.page_bytes(key), "utf-8")
+
+
+_open_stores: "OrderedDict[str, PageStore]" = OrderedDict()
+_open_lock = threading.Lock()
+
+
+def open_page_store(content_hash: str) -> Optional[PageStore]:
+    """Returns the mapped store for a document, or None if it has not been written yet."""
+    with _open_lock:
+        store = _open_stores.get(content_hash)
+        if store is not None:
+            _open_stores.move_to_end(content_hash)
+            return store
+    if not has_page_store(content_hash):
+        return None
+    try:
+        store = PageStore(content_hash)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not open page store for {content_hash}: {e}")
+        return None
+    with _open_lock:
+        _open_stores[content_hash] = store
+        # Evicted stores are unmapped once nothing references them any more
+        while len(_open_stores) > PAGE_STORE_OPEN_MAX:
+            _open_stores.popitem(last=False)
+    return store
@@ -0,0 +1,155 @@
+# Backend/pdf_extraction.py
+
+import os
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import fitz
+
+from extraction_cache import file_sha256, load_cached_extraction, store_extraction, PDF_EXTRACTION_PROFILE
+from page_store import has_page_store, write_page_store
+from sections import build_sections
+from text_preprocessor import normalize_pages, PROMPT_PREPROCESSING_ENABLED
+from scripts.round1a_main import process_pdf, detect_headers_and_footers
+
+logger = logging.getLogger(__name__)
+
+# --- Pool Settings ---
+PDF_EXTRACTION_WORKERS = int(os.getenv("PDF_EXTRACTION_WORKERS", os.cpu_count() or 2))
+# Upper bound on files being parsed at once by a single request
+PDF_EXTRACTION_CONCURRENCY = int(os.getenv("PDF_EXTRACTION_CONCURRENCY", PDF_EXTRACTION_WORKERS))
+
+# This variable will hold the single warm process pool
+extraction_pool: Optional[ProcessPoolExecutor] = None
+
+
+def extract_outline(file_path: str, doc: "fitz.Document", profile: str = PDF_EXTRACTION_PROFILE) -> Dict[str, Any]:
+    """
+    Title and H1/H2/... outline (1-based pages) from the round1a heading
+    extractor, falling back to the PDF's embedded table of contents. Also
+    returns round1a's run report (table probing, timings, headers/footers).
+    """
+    report = {}
+    try:
+        result = process_pdf(file_path, profile=profile, report=report)
+        title = result.get("title", "")
+        # round1a numbers pages from 0
+        outline = [{"level": h["level"], "text": h["text"], "page": h["page"] + 1} for h in result.get("outline", [])]
+        logger.info(f"Outline of {os.path.basename(file_path)} ({profile}): probed {len(report['table_probed_pages'])}/"
+                    f"{report['page_count']} pages for tables in {report['table_time_s']}s.")
+    except Exception as e:
+        logger.warning(f"Outline extraction failed for {file_path}: {e}")
+        title, outline = "", []
+    if not outline:
+        outline = [{"level": f"H{level}", "text": text, "page": page} for level, text, page in doc.get_toc()]
+    return {"title": title or doc.metadata.get("title", "") or "", "outline": outline, "report": report}
+
+
+def extract_pdf_document(file_path: str, profile: str = PDF_EXTRACTION_PROFILE) -> Dict[str, Any]:
+    """
+    Parses a PDF into its page texts (normalized for prompts), page count,
+    title, outline, heading-delimited sections and preprocessing token counts.
+    """
+    with fitz.open(file_path) as doc:
+        pages = [page.get_text() for page in doc]
+        outline = extract_outline(file_path, doc, profile)
+        if "headers_and_footers" in outline["report"]:
+            headers_and_footers = set(outline["report"]["headers_and_footers"])
+        else:
+            headers_and_footers = detect_headers_and_footers(doc) if PROMPT_PREPROCESSING_ENABLED else set()
+    if PROMPT_PREPROCESSING_ENABLED:
+        pages, text_stats = normalize_pages(pages, headers_and_footers)
+        logger.info(f"Preprocessed {os.path.basename(file_path)}: ~{text_stats['raw_tokens']} -> ~{text_stats['clean_tokens']} tokens.")
+    else:
+        text_stats = {}
+    sections = build_sections(pages, outline["outline"], outline["title"])
+    report = {k: v for k, v in outline["report"].items() if k != "headers_and_footers"}
+    return {"pages": pages, "page_count": len(pages), "title": outline["title"], "outline": outline["outline"],
+            "sections": sections, "text_stats": text_stats, "extraction_report": report}
+
+
+def extract_document(file_path: str, content_hash: Optional[str] = None, profile: str = PDF_EXTRACTION_PROFILE) -> Dict[str, Any]:
+    """
+    Runs inside a worker process. Serves the extraction from the content-hash
+    (and profile) keyed cache when the same bytes were parsed before, otherwise
+    parses and caches it. Also makes sure the document's memory-mapped page store exists.
+    """
+    content_hash = content_hash or file_sha256(file_path)
+    record = load_cached_extraction(content_hash, profile)
+    if record is None:
+        record = extract_pdf_document(file_path, profile)
+        store_extraction(content_hash, record, profile)
+    if not has_page_store(content_hash):
+        write_page_store(content_hash, record["pages"])
+    record["sha256"] = content_hash
+    return record
+
+
+def _warm_up_worker() -> int:
+    return os.getpid()
+
+
+def init_extraction_pool() -> ProcessPoolExecutor:
+    """Starts the extraction worker processes. Called once from the app startup event."""
+    global extraction_pool
+    if extraction_pool is None:
+        extraction_pool = ProcessPoolExecutor(max_workers=PDF_EXTRACTION_WORKERS)
+        # Spawn every worker now so the first upload does not pay process start-up cost
+        for future in [extraction_pool.submit(_warm_up_worker) for _ in range(PDF_EXTRACTION_WORKERS)]:
+            future.result()
+        logger.info(f"✅ PDF extraction pool ready with {PDF_EXTRACTION_WORKERS} workers.")
+    return extraction_pool
+
+
+def get_extraction_pool() -> ProcessPoolExecutor:
+    global extraction_pool
+    if extraction_pool is None:
+        extraction_pool = ProcessPoolExecutor(max_workers=PDF_EXTRACTION_WORKERS)
+    return extraction_pool
+
+
+def close_extraction_pool():
+    """Stops the extraction worker processes. Called once from the app shutdown event."""
+    global extraction_pool
+    if extraction_pool is not None:
+        extraction_pool.shutdown(wait=False, cancel_futures=True)
+        extraction_pool = None
+        logger.info("✅ PDF extraction pool closed.")
+
+
+async def extract(file_path: str, content_hash: Optional[str] = None, profile: Optional[str] = None) -> Dict[str, Any]:
+    """Extracts one PDF in the process pool without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_extraction_pool(), extract_document, file_path, content_hash,
+                                      profile or PDF_EXTRACTION_PROFILE)
+
+
+async def extract_many(file_paths: Sequence[str], content_hashes: Optional[Dict[str, str]] = None,
+                       on_done: Optional[Callable[[str, object], None]] = None, profile: Optional[str] = None) -> List[object]:
+    """
+    Extracts several PDFs in parallel, at most PDF_EXTRACTION_CONCURRENCY at a
+    time. `content_hashes` maps paths whose SHA-256 is already known (e.g. hashed
+    during upload) so workers skip re-reading them. `on_done(path, record)` is
+    called as each file finishes, for progress reporting. `profile` picks the
+    outline extraction profile (see EXTRACTION_PROFILES). Returns extraction
+    records ({sha256, pages, page_count, title, outline, sections, text_stats, extraction_report}) in input order, or the
+    exception for files that failed.
+    """
+    content_hashes = content_hashes or {}
+    semaphore = asyncio.Semaphore(PDF_EXTRACTION_CONCURRENCY)
+
+    async def run(file_path: str):
+        async with semaphore:
+            try:
+                record = await extract(file_path, content_hashes.get(file_path), profile)
+            except Exception as e:
+                record = e
+        if on_done:
+            on_done(file_path, record)
+        if isinstance(record, Exception):
+            raise record
+        return record
+
+    return await asyncio.gather(*(run(path) for path in file_paths), return_exceptions=True)
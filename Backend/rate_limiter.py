@@ -0,0 +1,162 @@
+# Backend/rate_limiter.py
+
+import os
+import time
+import heapq
+import random
+import asyncio
+import logging
+import itertools
+import email.utils
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# --- Priority Classes (lower value is served first) ---
+PRIORITY_INTERACTIVE = 0   # /chat/, /insights-on-selection
+PRIORITY_ANALYSIS = 1      # /analyze/
+PRIORITY_BACKGROUND = 2    # /translate-insights/, podcast generation
+
+# --- Quota Settings ---
+GEMINI_RPM_LIMIT = int(os.getenv("GEMINI_RPM_LIMIT", 60))
+GEMINI_TPM_LIMIT = int(os.getenv("GEMINI_TPM_LIMIT", 1_000_000))
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+
+
+def parse_retry_after(headers) -> Optional[float]:
+    """Reads a Retry-After header given either as seconds or as an HTTP date."""
+    value = headers.get("retry-after") if headers is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+        return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Continuously refilling bucket holding at most `capacity` units per minute."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(max(1, per_minute))
+        self.rate = self.capacity / 60.0
+        self.available = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def time_until(self, amount: float) -> float:
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.available >= amount:
+            return 0.0
+        return (amount - self.available) / self.rate
+
+    def consume(self, amount: float):
+        self._refill()
+        # May go negative when reconciling actual usage; the deficit is paid back by refill
+        self.available -= amount
+
+
+class GeminiRateLimiter:
+    """
+    Process-wide scheduler for Gemini calls. Callers queue by priority class and
+    are released only when both the requests/min and tokens/min buckets allow it
+    and no shared backoff (set by a 429/503) is in effect.
+    """
+
+    def __init__(self, rpm: int = GEMINI_RPM_LIMIT, tpm: int = GEMINI_TPM_LIMIT):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self._queue = []
+        self._sequence = itertools.count()
+        self._changed = asyncio.Event()
+        self._backoff_until = 0.0
+        self._consecutive_throttles = 0
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _wait(self, timeout: Optional[float]):
+        event = self._changed
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def _time_until_available(self, tokens: int) -> float:
+        backoff = self._backoff_until - time.monotonic()
+        return max(backoff, self.requests.time_until(1), self.tokens.time_until(tokens))
+
+    async def acquire(self, priority: int = PRIORITY_ANALYSIS, tokens: int = 1):
+        """Waits until this call may be sent, serving higher-priority callers first."""
+        waiter = (priority, next(self._sequence), tokens)
+        heapq.heappush(self._queue, waiter)
+        try:
+            while True:
+                delay = None
+                if self._queue[0] is waiter:
+                    delay = self._time_until_available(tokens)
+                    if delay <= 0:
+                        heapq.heappop(self._queue)
+                        self.requests.consume(1)
+                        self.tokens.consume(min(tokens, self.tokens.capacity))
+                        self._notify()
+                        return
+                await self._wait(delay)
+        except asyncio.CancelledError:
+            if waiter in self._queue:
+                self._queue.remove(waiter)
+                heapq.heapify(self._queue)
+                self._notify()
+            raise
+
+    def reconcile(self, estimated_tokens: int, actual_tokens: Optional[int]):
+        """Charges the tokens/min bucket for the difference between estimate and actual usage."""
+        if actual_tokens and actual_tokens > estimated_tokens:
+            self.tokens.consume(actual_tokens - estimated_tokens)
+
+    def report_success(self):
+        self._consecutive_throttles = 0
+
+    def report_throttled(self, retry_after: Optional[float] = None) -> float:
+        """
+        Records a 429/503 and pushes the shared backoff out for every caller.
+        Honors Retry-After when given, otherwise backs off exponentially with jitter.
+        """
+        self._consecutive_throttles += 1
+        if retry_after is None:
+            retry_after = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** (self._consecutive_throttles - 1)))
+            retry_after += random.uniform(0, 1)
+        self._backoff_until = max(self._backoff_until, time.monotonic() + retry_after)
+        self._notify()
+        return retry_after
+
+    def get_stats(self) -> dict:
+        return {
+            "queued": len(self._queue),
+            "backoff_remaining": max(0.0, round(self._backoff_until - time.monotonic(), 2)),
+            "requests_available": round(self.requests.available, 2),
+            "tokens_available": round(self.tokens.available, 2),
+        }
+
+
+# This variable will hold the single rate limiter instance
+rate_limiter: Optional[GeminiRateLimiter] = None
+
+
+def get_rate_limiter() -> GeminiRateLimiter:
+    global rate_limiter
+    if rate_limiter is None:
+        rate_limiter = GeminiRateLimiter()
+    return rate_limiter
@@ -0,0 +1,203 @@
+# Backend/retrieval.py
+
+import os
+import re
+import json
+import hashlib
+import logging
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+
+logger = logging.getLogger(__name__)
+
+# --- Settings ---
+RETRIEVAL_ENABLED = os.getenv("RETRIEVAL_ENABLED", "true").lower() in ("1", "true", "yes")
+RETRIEVAL_INDEX_DIR = os.getenv("RETRIEVAL_INDEX_DIR", "index_cache")
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", 40))
+RETRIEVAL_MIN_PAGES_PER_DOC = int(os.getenv("RETRIEVAL_MIN_PAGES_PER_DOC", 1))
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_TOKEN_PATTERN = re.compile(r"[^\W_]+", re.UNICODE)
+_STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or that the this to was were will with
+i me my we our you your he she they them their what which who whom how when where why can do does
+not no but if then so than too very just about into over under also all any each more most other some
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN_PATTERN.findall(text.lower()) if len(t) > 1 and t not in _STOPWORDS]
+
+
+def pages_fingerprint(pages: Sequence[str]) -> str:
+    """Content hash of a document's page texts; identifies its persisted index."""
+    digest = hashlib.sha256()
+    for text in pages:
+        digest.update(text.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class PageIndex:
+    """
+    Sparse term-frequency matrix (pages x terms) for one document, plus its
+    vocabulary and page lengths. BM25 weights are computed at query time so
+    IDF can span every document being searched.
+    """
+
+    def __init__(self, vocab: Dict[str, int], tf: sparse.csr_matrix, lengths: np.ndarray):
+        self.vocab = vocab
+        self.tf = tf
+        self.lengths = lengths
+
+    @property
+    def page_count(self) -> int:
+        return self.tf.shape[0]
+
+    @classmethod
+    def build(cls, pages: Sequence[str]) -> "PageIndex":
+        vocab: Dict[str, int] = {}
+        rows, cols, data, lengths = [], [], [], []
+        for page_idx, text in enumerate(pages):
+            counts = Counter(tokenize(text))
+            lengths.append(sum(counts.values()))
+            for term, count in counts.items():
+                rows.append(page_idx)
+                cols.append(vocab.setdefault(term, len(vocab)))
+                data.append(count)
+        tf = sparse.csr_matrix((np.asarray(data, dtype=np.float32), (rows, cols)),
+                               shape=(len(pages), len(vocab)), dtype=np.float32)
+        return cls(vocab, tf, np.asarray(lengths, dtype=np.float32))
+
+    def save(self, path_prefix: str):
+        tmp_matrix, tmp_meta = f"{path_prefix}.npz.tmp", f"{path_prefix}.json.tmp"
+        with open(tmp_matrix, "wb") as f:
+            sparse.save_npz(f, self.tf)
+        with open(tmp_meta, "w", encoding="utf-8") as f:
+            json.dump({"vocab": self.vocab, "lengths": self.lengths.tolist()}, f, ensure_ascii=False)
+        os.replace(tmp_matrix, f"{path_prefix}.npz")
+        os.replace(tmp_meta, f"{path_prefix}.json")
+
+    @classmethod
+    def load(cls, path_prefix: str) -> Optional["PageIndex"]:
+        try:
+            tf = sparse.load_npz(f"{path_prefix}.npz").tocsr()
+            with open(f"{path_prefix}.json", encoding="utf-8") as f:
+                meta = json.load(f)
+            return cls(meta["vocab"], tf, np.asarray(meta["lengths"], dtype=np.float32))
+        except (OSError, ValueError, KeyError):
+            return None
+
+
+def get_or_build_index(pages: Sequence[str]) -> PageIndex:
+    """Loads the persisted index for these pages, building and saving it on first use."""
+    os.makedirs(RETRIEVAL_INDEX_DIR, exist_ok=True)
+    # Page stores already know their content identity, so they are not re-hashed page by page
+    fingerprint = getattr(pages, "fingerprint", None) or pages_fingerprint(pages)
+    path_prefix = os.path.join(RETRIEVAL_INDEX_DIR, fingerprint)
+    index = PageIndex.load(path_prefix)
+    if index is None or index.page_count != len(pages):
+        index = PageIndex.build(pages)
+        try:
+            index.save(path_prefix)
+        except OSError as e:
+            logger.warning(f"Could not persist retrieval index: {e}")
+    return index
+
+
+def rank_pages(indexes: List[PageIndex], query: str) -> List[Tuple[float, int, int]]:
+    """Scores every page of every index against the query with BM25. Returns (score, index_no, page_idx)."""
+    query_terms = sorted(set(tokenize(query)))
+    total_pages = sum(index.page_count for index in indexes)
+    if not query_terms or total_pages == 0:
+        return []
+    avg_length = max(1.0, float(sum(index.lengths.sum() for index in indexes)) / total_pages)
+
+    # Document frequency of each query term across all pages being searched
+    doc_freq = np.zeros(len(query_terms), dtype=np.float32)
+    for index in indexes:
+        for q, term in enumerate(query_terms):
+            col = index.vocab.get(term)
+            if col is not None:
+                doc_freq[q] += index.tf[:, col].count_nonzero()
+    idf = np.log(1.0 + (total_pages - doc_freq + 0.5) / (doc_freq + 0.5))
+
+    ranked = []
+    for index_no, index in enumerate(indexes):
+        present = [(q, index.vocab[term]) for q, term in enumerate(query_terms) if term in index.vocab]
+        if not present:
+            scores = np.zeros(index.page_count, dtype=np.float32)
+        else:
+            q_ids, cols = zip(*present)
+            tf = index.tf[:, list(cols)].toarray()
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * index.lengths / avg_length)
+            scores = (tf * (BM25_K1 + 1) / (tf + norm[:, None])) @ idf[list(q_ids)]
+        ranked.extend((float(score), index_no, page_idx) for page_idx, score in enumerate(scores))
+    ranked.sort(key=lambda r: r[0], reverse=True)
+    return ranked
+
+
+def select_top_units(unit_texts: List[Sequence[str]], query: str, top_k: int) -> Optional[List[List[int]]]:
+    """
+    Picks the top-k units (pages or sections) across documents, keeping at least
+    RETRIEVAL_MIN_PAGES_PER_DOC per document so every document stays visible.
+    Returns the selected unit indexes per document, or None if nothing needs narrowing.
+    """
+    total_units = sum(len(units) for units in unit_texts)
+    if total_units <= top_k:
+        return None
+    indexes = [get_or_build_index(units) for units in unit_texts]
+    ranked = rank_pages(indexes, query)
+    if not ranked:
+        return None
+
+    selected = {doc_no: set() for doc_no in range(len(unit_texts))}
+    for _, doc_no, unit_idx in ranked:
+        if len(selected[doc_no]) < RETRIEVAL_MIN_PAGES_PER_DOC:
+            selected[doc_no].add(unit_idx)
+    budget = top_k - sum(len(units) for units in selected.values())
+    for _, doc_no, unit_idx in ranked:
+        if budget <= 0:
+            break
+        if unit_idx not in selected[doc_no]:
+            selected[doc_no].add(unit_idx)
+            budget -= 1
+    return [sorted(selected[doc_no]) for doc_no in range(len(unit_texts))]
+
+
+def select_relevant_pages(documents: List[Dict[str, Any]], query: str,
+                          top_k: int = RETRIEVAL_TOP_K) -> List[Dict[str, Any]]:
+    """
+    Narrows extracted documents to the top-k pages most relevant to the query.
+    Returned documents carry explicit page numbers.
+    """
+    selection = select_top_units([doc["pages"] for doc in documents], query, top_k)
+    if selection is None:
+        return documents
+    narrowed = []
+    for doc, page_idxs in zip(documents, selection):
+        narrowed.append({
+            **doc,
+            "pages": [doc["pages"][i] for i in page_idxs],
+            "page_numbers": [i + 1 for i in page_idxs],
+            "is_new": True,
+        })
+    total_pages = sum(len(doc["pages"]) for doc in documents)
+    logger.info(f"Retrieval kept {sum(len(d['pages']) for d in narrowed)} of {total_pages} pages.")
+    return narrowed
+
+
+def select_relevant_sections(documents: List[Dict[str, Any]], query: str,
+                             top_k: int = RETRIEVAL_TOP_K) -> List[Dict[str, Any]]:
+    """Same as select_relevant_pages, over documents' materialized heading sections."""
+    selection = select_top_units([[s["text"] for s in doc["sections"]] for doc in documents], query, top_k)
+    if selection is None:
+        return documents
+    narrowed = [{**doc, "sections": [doc["sections"][i] for i in idxs], "is_new": True} for doc, idxs in zip(documents, selection)]
+    total_sections = sum(len(doc["sections"]) for doc in documents)
+    logger.info(f"Retrieval kept {sum(len(d['sections']) for d in narrowed)} of {total_sections} sections.")
+    return narrowed
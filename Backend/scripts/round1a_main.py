@@ -1233,38 +1233,133 @@
 
 
 import fitz  # PyMuPDF
+import io
 import json
+import math
 import os
 import re
 import time
+import signal
+import contextlib
+import multiprocessing
+from array import array
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
 from collections import Counter
+import numpy as np
 import pandas as pd
 import joblib
 
-def detect_headers_and_footers(doc, line_threshold=0.4):
+# --- Extraction Profiles ---
+# fast: no table detection; balanced: find_tables() only on pages whose drawings
+# or text alignment suggest a table; accurate: find_tables() on every page.
+EXTRACTION_PROFILES = ("fast", "balanced", "accurate")
+DEFAULT_PROFILE = "accurate"
+TABLE_MIN_RULED_LINES = 4   # horizontal/vertical rules (or rect edges) that make a page worth probing
+TABLE_MIN_GRID_ROWS = 3     # rows of 3+ separate text cells sharing column positions
+
+def has_ruled_lines(page):
+    """Cheap table hint: enough horizontal/vertical vector rules or rectangles on the page."""
+    rules = 0
+    for drawing in page.get_drawings():
+        for item in drawing["items"]:
+            if item[0] == "re":
+                rules += 4
+            elif item[0] == "l":
+                p1, p2 = item[1], item[2]
+                if abs(p1.x - p2.x) < 1 or abs(p1.y - p2.y) < 1:
+                    rules += 1
+            if rules >= TABLE_MIN_RULED_LINES:
+                return True
+    return False
+
+def has_text_grid(blocks):
+    """Cheap table hint: several text rows split into 3+ cells that start at the same x positions."""
+    rows = {}
+    for block in blocks:
+        for line in block["lines"]:
+            rows.setdefault(round(line["bbox"][1]), set()).add(round(line["bbox"][0] / 5))
+    grid_rows = [cells for cells in rows.values() if len(cells) >= 3]
+    if len(grid_rows) < TABLE_MIN_GRID_ROWS:
+        return False
+    column_hits = Counter(x for cells in grid_rows for x in cells)
+    shared_columns = [x for x, count in column_hits.items() if count >= TABLE_MIN_GRID_ROWS]
+    return len(shared_columns) >= 3
+
+def should_probe_tables(page, blocks, profile):
+    if profile == "fast":
+        return False
+    if profile == "accurate":
+        return True
+    return has_text_grid(blocks) or has_ruled_lines(page)
+
+TEXT_DICT_FLAGS = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES
+
+def find_table_areas(page):
+    # Keep only the areas; the finder holds the page's characters, edges and cells
+    return [t.bbox for t in page.find_tables().tables]
+
+def extract_page_data(page, page_num, profile=DEFAULT_PROFILE):
     """
-    Detects repeating text that is likely a header or footer based on
-    frequency and position on the page. This is a critical first step.
+    Extracts everything the pipeline needs from a page in a single text pass:
+    page geometry, the text blocks with their lines/spans/bboxes (from
+    get_text("dict")) and the page's table areas. Header/footer detection,
+    layout detection, table filtering and line collection all read from this.
+    Whether find_tables() runs depends on the extraction profile.
     """
-    page_count = len(doc)
-    if page_count < 4: return set()
-
-    text_counts = Counter()
-    # Scan the middle half of the document to avoid title and reference pages
+    table_bboxes, table_time = [], 0.0
+    table_probed = profile == "accurate"
+    if table_probed:
+        # Probed before the text pass, so find_tables' working set and the
+        # page's text dict are never alive at the same time
+        table_start = time.time()
+        table_bboxes = find_table_areas(page)
+        table_time = time.time() - table_start
+
+    blocks = []
+    # Image blocks are skipped, so their pixel data is never extracted
+    for block in page.get_text("dict", flags=TEXT_DICT_FLAGS)["blocks"]:
+        if "lines" not in block:  # image block
+            continue
+        # Same text as get_text("blocks") would give for this block
+        block_text = "\n".join("".join(span["text"] for span in line["spans"]) for line in block["lines"])
+        blocks.append({"bbox": block["bbox"], "lines": block["lines"], "text": block_text})
+
+    if profile == "balanced":
+        table_start = time.time()
+        table_probed = should_probe_tables(page, blocks, profile)
+        if table_probed:
+            table_bboxes = find_table_areas(page)
+        table_time = time.time() - table_start
+
+    return {
+        "page": page_num,
+        "width": page.rect.width,
+        "height": page.rect.height,
+        "blocks": blocks,
+        "table_bboxes": table_bboxes,
+        "table_probed": table_probed,
+        "table_time": table_time,
+    }
+
+def header_scan_range(page_count):
+    """Pages scanned for headers/footers: the middle half of the document, avoiding title and reference pages."""
     start_page = page_count // 4
-    end_page = page_count - start_page
+    return start_page, page_count - start_page
 
-    for page_num in range(start_page, end_page):
-        page = doc[page_num]
-        page_height = page.rect.height
-        blocks = page.get_text("blocks")
-        for b in blocks:
-            # Check a wider vertical area: top 20% and bottom 15% of the page
-            if b[1] < page_height * 0.20 or b[3] > page_height * 0.85:
-                line_text = b[4].strip().replace('\n', ' ')
-                if 5 < len(line_text) < 100 and not line_text.endswith('.'):
-                    text_counts[line_text] += 1
-    
+def count_header_candidates(page_height, blocks, text_counts):
+    """Adds the texts of a page's blocks that sit where headers/footers do to `text_counts`."""
+    for b in blocks:
+        # Check a wider vertical area: top 20% and bottom 15% of the page
+        if b[1] < page_height * 0.20 or b[3] > page_height * 0.85:
+            line_text = b[4].strip().replace('\n', ' ')
+            if 5 < len(line_text) < 100 and not line_text.endswith('.'):
+                text_counts[line_text] += 1
+
+def select_headers_and_footers(text_counts, page_count, line_threshold=0.4):
+    """Turns candidate counts from the scanned pages into the set of texts to ignore."""
+    if page_count < 4: return set()
+    start_page, end_page = header_scan_range(page_count)
     ignore_set = set()
     # Lower the threshold to catch text that appears on 40% of scanned pages
     min_occurrences = (end_page - start_page) * line_threshold
@@ -1275,6 +1370,28 @@ def detect_headers_and_footers(doc, line_threshold=0.4):
     print(f"INFO: Detected {len(ignore_set)} repeating lines to ignore as headers/footers.")
     return ignore_set
 
+def detect_headers_and_footers(doc, line_threshold=0.4, page_data=None):
+    """
+    Detects repeating text that is likely a header or footer based on
+    frequency and position on the page. This is a critical first step.
+    Reads the blocks from `page_data` (see extract_page_data) when given.
+    """
+    page_count = len(doc)
+    if page_count < 4: return set()
+
+    text_counts = Counter()
+    start_page, end_page = header_scan_range(page_count)
+    for page_num in range(start_page, end_page):
+        if page_data is not None:
+            page_height = page_data[page_num]["height"]
+            blocks = [(*b["bbox"], b["text"]) for b in page_data[page_num]["blocks"]]
+        else:
+            page = doc[page_num]
+            page_height = page.rect.height
+            blocks = page.get_text("blocks")
+        count_header_candidates(page_height, blocks, text_counts)
+    return select_headers_and_footers(text_counts, page_count, line_threshold)
+
 def is_line_in_table(line_bbox, page_table_areas):
     """Checks if a line's bounding box is inside any of a page's table areas."""
     if not page_table_areas:
@@ -1317,15 +1434,15 @@ def is_mostly_uppercase(s):
     uppercase_letters = [char for char in letters if char.isupper()]
     return (len(uppercase_letters) / len(letters)) > 0.8
 
-def get_page_layout(page, threshold=0.3):
+def get_page_layout(page_info, threshold=0.3):
     """
-    Analyzes the layout of a page to determine if it is single or multi-column.
-    Returns the number of detected columns (1 or 2).
+    Analyzes the layout of a page (see extract_page_data) to determine if it is
+    single or multi-column. Returns the number of detected columns (1 or 2).
     """
-    page_width = page.rect.width
+    page_width = page_info["width"]
     midpoint = page_width / 2
     
-    blocks = page.get_text("blocks")
+    blocks = page_info["blocks"]
     if not blocks:
         return 1 # Default to 1 column if no text
 
@@ -1333,9 +1450,10 @@ def get_page_layout(page, threshold=0.3):
     right_blocks = 0
     
     for b in blocks:
-        if b[2] < midpoint: # Block ends before midpoint
+        x0, _, x1, _ = b["bbox"]
+        if x1 < midpoint: # Block ends before midpoint
             left_blocks += 1
-        elif b[0] > midpoint: # Block starts after midpoint
+        elif x0 > midpoint: # Block starts after midpoint
             right_blocks += 1
 
     total_sided_blocks = left_blocks + right_blocks
@@ -1349,90 +1467,269 @@ def get_page_layout(page, threshold=0.3):
     
     return 1
 
-def process_pdf(pdf_path, ml_output_path=None):
+# --- Columnar Line Table ---
+# One row per text line instead of an 11-key dict: text is interned into a
+# list of strings and referenced by index, the style (rounded size, bold) is
+# stored as two small columns and numbered through a style table after merging.
+LINE_DTYPE = np.dtype([
+    ("page", np.int32), ("text", np.int32), ("style", np.int32),
+    ("size", np.int16), ("is_bold", np.bool_), ("column", np.int8),
+    ("x0", np.float64), ("y0", np.float64), ("x1", np.float64), ("y1", np.float64),
+])
+
+class LineTableBuilder:
     """
-    Processes a PDF using a hybrid ML and rule-based filtering approach.
+    Accumulates line rows for one shard and interns their text. Rows are
+    appended to compact typed arrays, one per column, rather than kept as
+    Python objects until the table is built.
     """
-    doc = fitz.open(pdf_path)
-    ignored_texts = detect_headers_and_footers(doc)
-    
-    table_areas = {}
-    for page_num, page in enumerate(doc):
-        tables = page.find_tables()
-        if tables.tables:
-            table_areas[page_num] = [t.bbox for t in tables]
-    
-    if table_areas:
-        print(f"INFO: Detected tables on pages: {list(table_areas.keys())}")
-        
-    all_lines = []
-    style_counts = Counter()
-    page_heights = {}
-    
-    for page_num, page in enumerate(doc):
-        page_width = page.rect.width
-        page_heights[page_num] = page.rect.height
-        page_table_bboxes = table_areas.get(page_num, [])
-        
-        num_columns = get_page_layout(page)
-        page_midpoint = page_width / 2
 
-        blocks = page.get_text("dict")["blocks"]
-        for block in blocks:
-            if "lines" in block:
-                for line in block["lines"]:
-                    if not line["spans"]: continue
+    _TYPECODES = {"page": "i", "text": "i", "size": "h", "is_bold": "b", "column": "b",
+                  "x0": "d", "y0": "d", "x1": "d", "y1": "d"}
+
+    def __init__(self):
+        self.columns = {name: array(typecode) for name, typecode in self._TYPECODES.items()}
+        self.texts = []
+        self._text_ids = {}
+
+    def add(self, page_num, text, style, column, bbox):
+        text_id = self._text_ids.get(text)
+        if text_id is None:
+            text_id = self._text_ids[text] = len(self.texts)
+            self.texts.append(text)
+        columns = self.columns
+        columns["page"].append(page_num)
+        columns["text"].append(text_id)
+        columns["size"].append(style[0])
+        columns["is_bold"].append(style[1])
+        columns["column"].append(column)
+        columns["x0"].append(bbox[0])
+        columns["y0"].append(bbox[1])
+        columns["x1"].append(bbox[2])
+        columns["y1"].append(bbox[3])
+
+    def build(self):
+        table = np.empty(len(self.columns["page"]), dtype=LINE_DTYPE)
+        for name, values in self.columns.items():
+            table[name] = np.frombuffer(values, dtype=values.typecode) if len(values) else []
+            self.columns[name] = array(values.typecode)  # release each column once copied
+        table["style"] = -1
+        self._text_ids = {}
+        return table, self.texts
+
+def merge_line_tables(parts):
+    """Concatenates (rows, texts) tables in order, re-basing each part's text ids."""
+    tables, texts = [], []
+    for rows, part_texts in parts:
+        rows["text"] += len(texts)
+        tables.append(rows)
+        texts.extend(part_texts)
+    return (np.concatenate(tables) if tables else np.empty(0, dtype=LINE_DTYPE)), texts
+
+def build_style_table(lines):
+    """
+    Numbers the (size, is_bold) styles in first-seen order, writes each row's
+    style id into lines["style"] and returns (styles, row count per style).
+    """
+    keys = lines["size"].astype(np.int64) * 2 + lines["is_bold"]
+    unique_keys, first_rows, inverse, counts = np.unique(keys, return_index=True, return_inverse=True, return_counts=True)
+    order = np.argsort(first_rows, kind="stable")
+    style_ids = np.empty_like(order)
+    style_ids[order] = np.arange(len(order))
+    lines["style"] = style_ids[inverse.reshape(-1)]
+    styles = [(int(unique_keys[k] // 2), bool(unique_keys[k] % 2)) for k in order]
+    return styles, counts[order]
+
+def deduce_body_style(styles, style_counts):
+    """The most common non-bold style (any style if all are bold); ties go to the style seen first, as with Counter.most_common."""
+    candidates = [n for n, style in enumerate(styles) if not style[1]] or list(range(len(styles)))
+    if not candidates:
+        return (10, False)
+    return styles[candidates[int(np.argmax(style_counts[candidates]))]]
+
+def is_heading_text(text):
+    """Basic text filters for a heading candidate."""
+    if not (3 < len(text) < 250): return False
+    if len(text.split()) > 25: return False # Exclude long lines
+    if re.fullmatch(r"[\d\W_]+", text): return False # Exclude lines with only numbers/symbols
+    if text.endswith(('.', ',', ';')) and len(text.split()) > 15: return False
+    return True
+
+def line_record(row, texts, styles):
+    """A table row as the dict the title and heading-merging steps work on."""
+    style = styles[row["style"]]
+    return {
+        "page": int(row["page"]),
+        "text": texts[row["text"]],
+        "style": style,
+        "is_bold": style[1],
+        "size": style[0],
+        "x0": float(row["x0"]),
+        "y0": float(row["y0"]),
+        "x1": float(row["x1"]),
+        "y1": float(row["y1"]),
+        "column": int(row["column"]),
+        "id": (int(row["page"]), float(row["y0"])),
+    }
+
+# --- Page-Range Sharding ---
+SHARD_MIN_PAGES = 16        # documents shorter than this are not worth splitting
+SHARDS_PER_WORKER = 2       # a few more shards than workers evens out slow page ranges
+
+def collect_page_lines(page_info, lines):
+    """
+    Adds one page's lines (see extract_page_data) to a LineTableBuilder for
+    heading analysis, skipping table, date and "Page x of y" lines.
+    Header/footer lines are removed later, once they are known for the whole
+    document.
+    """
+    page_num = page_info["page"]
+    page_width = page_info["width"]
+    page_table_bboxes = page_info["table_bboxes"]
 
-                    if is_line_in_table(line["bbox"], page_table_bboxes):
-                        continue
+    num_columns = get_page_layout(page_info)
+    page_midpoint = page_width / 2
 
-                    line_text = "".join(span["text"] for span in line["spans"]).strip()
-                    if not line_text or line_text in ignored_texts: continue
+    blocks = page_info["blocks"]
+    for block in blocks:
+        if "lines" in block:
+            for line in block["lines"]:
+                if not line["spans"]: continue
 
-                    is_date = False
-                    text_lower = line_text.lower()
-                    if re.search(r'\b\d{4}\b', text_lower):
-                        if any(month in text_lower for month in ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec']):
-                            if len(line_text.split()) <= 4:
-                                is_date = True
-                    if is_date:
-                        continue
+                if is_line_in_table(line["bbox"], page_table_bboxes):
+                    continue
 
-                    if re.match(r'^Page \d+\s*of\s*\d+$', line_text, re.I): 
-                        continue
+                line_text = "".join(span["text"] for span in line["spans"]).strip()
+                if not line_text: continue
+
+                is_date = False
+                text_lower = line_text.lower()
+                if re.search(r'\b\d{4}\b', text_lower):
+                    if any(month in text_lower for month in ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec']):
+                        if len(line_text.split()) <= 4:
+                            is_date = True
+                if is_date:
+                    continue
 
-                    style = get_dominant_style(line)
-                    style_counts[style] += 1
-
-                    line_center_x = (line["bbox"][0] + line["bbox"][2]) / 2
-                    column_index = 0
-                    if num_columns == 2 and line_center_x > page_midpoint:
-                        column_index = 1
-
-                    # Create a single entry for the entire line
-                    all_lines.append({
-                        "page": page_num,
-                        "text": line_text,
-                        "style": style,
-                        "is_bold": style[1],
-                        "size": style[0],
-                        "x0": line["bbox"][0],
-                        "y0": line["bbox"][1],
-                        "x1": line["bbox"][2],
-                        "y1": line["bbox"][3],
-                        "column": column_index,
-                        "id": f"{page_num}-{line['bbox'][1]}",
-                    })
-
-    if not all_lines:
+                if re.match(r'^Page \d+\s*of\s*\d+$', line_text, re.I): 
+                    continue
+
+                style = get_dominant_style(line)
+
+                line_center_x = (line["bbox"][0] + line["bbox"][2]) / 2
+                column_index = 0
+                if num_columns == 2 and line_center_x > page_midpoint:
+                    column_index = 1
+
+                # Create a single entry for the entire line
+                lines.add(page_num, line_text, style, column_index, line["bbox"])
+
+def extract_shard(pdf_path, start_page, end_page, profile=DEFAULT_PROFILE):
+    """
+    Extracts pages [start_page, end_page) of a PDF, opening it independently
+    so shards can run in separate processes. Returns the shard's line table
+    and interned texts, its header/footer candidate counts and per-page
+    geometry and table-probe stats, all of which merge by simple concatenation
+    or addition.
+    """
+    header_counts = Counter()
+    builder = LineTableBuilder()
+    pages = []
+    # Pages are streamed: each page's text dict is dropped before the next one is
+    # extracted, so memory is bounded by one page rather than by the shard
+    with fitz.open(pdf_path) as doc:
+        scan_start, scan_end = header_scan_range(len(doc))
+        for page_num in range(start_page, end_page):
+            page_info = extract_page_data(doc[page_num], page_num, profile)
+            if scan_start <= page_num < scan_end:
+                blocks = [(*b["bbox"], b["text"]) for b in page_info["blocks"]]
+                count_header_candidates(page_info["height"], blocks, header_counts)
+            collect_page_lines(page_info, builder)
+            pages.append({"page": page_num, "width": page_info["width"], "height": page_info["height"],
+                          "has_tables": bool(page_info["table_bboxes"]), "table_probed": page_info["table_probed"],
+                          "table_time": page_info["table_time"]})
+            del page_info
+    lines, texts = builder.build()
+    return {"lines": lines, "texts": texts, "header_counts": header_counts, "pages": pages}
+
+def _extract_shard_task(args):
+    return extract_shard(*args)
+
+def shard_page_ranges(page_count, workers):
+    """Contiguous page ranges for `workers` processes, at least SHARD_MIN_PAGES pages each."""
+    shard_size = max(SHARD_MIN_PAGES, math.ceil(page_count / (workers * SHARDS_PER_WORKER)))
+    return [(start, min(start + shard_size, page_count)) for start in range(0, page_count, shard_size)]
+
+def extract_shards(pdf_path, profile=DEFAULT_PROFILE, workers=1):
+    """Extracts a whole PDF, split across `workers` processes when it is long enough to pay off."""
+    with fitz.open(pdf_path) as doc:
+        page_count = len(doc)
+    ranges = shard_page_ranges(page_count, workers) if workers > 1 else [(0, page_count)]
+    if len(ranges) < 2:
+        return page_count, [extract_shard(pdf_path, 0, page_count, profile)]
+    print(f"INFO: Splitting {page_count} pages into {len(ranges)} shards across {workers} workers.")
+    tasks = [(pdf_path, start, end, profile) for start, end in ranges]
+    with multiprocessing.Pool(min(workers, len(tasks))) as pool:
+        # map keeps shard order, so the merged lines stay in page order
+        return page_count, pool.map(_extract_shard_task, tasks)
+
+def process_pdf(pdf_path, ml_output_path=None, profile=DEFAULT_PROFILE, report=None, workers=1):
+    """
+    Processes a PDF using a hybrid ML and rule-based filtering approach.
+    `profile` selects how much table detection runs (see EXTRACTION_PROFILES).
+    With `workers` > 1 a long document's pages are extracted in parallel
+    shards; the document-wide steps run once on the merged result.
+    If `report` is a dict it is filled with the pages probed for tables and
+    the time spent.
+    """
+    if profile not in EXTRACTION_PROFILES:
+        raise ValueError(f"Unknown extraction profile '{profile}'. Choose from {EXTRACTION_PROFILES}.")
+    start_time = time.time()
+    page_count, shards = extract_shards(pdf_path, profile, workers)
+
+    # Merge the shards: line tables in page order, candidate counts by addition
+    all_lines, texts = merge_line_tables([(shard["lines"], shard["texts"]) for shard in shards])
+    header_counts = Counter()
+    pages = []
+    for shard in shards:
+        header_counts.update(shard["header_counts"])
+        pages.extend(shard["pages"])
+    ignored_texts = select_headers_and_footers(header_counts, page_count)
+    if ignored_texts:
+        ignored_ids = [text_id for text_id, text in enumerate(texts) if text in ignored_texts]
+        all_lines = all_lines[~np.isin(all_lines["text"], ignored_ids)]
+    
+    table_pages = [info["page"] for info in pages if info["has_tables"]]
+    if table_pages:
+        print(f"INFO: Detected tables on pages: {table_pages}")
+    probed_pages = [info["page"] for info in pages if info["table_probed"]]
+    table_time = sum(info["table_time"] for info in pages)
+    print(f"INFO: Profile '{profile}' probed {len(probed_pages)}/{len(pages)} pages for tables in {table_time:.2f}s.")
+    if report is not None:
+        report.update({
+            "profile": profile,
+            "page_count": len(pages),
+            "shards": len(shards),
+            "table_probed_pages": probed_pages,
+            "table_pages": table_pages,
+            "table_time_s": round(table_time, 3),
+            "extraction_time_s": round(time.time() - start_time, 3),
+            "headers_and_footers": sorted(ignored_texts),
+        })
+        
+    page_heights = {info["page"]: info["height"] for info in pages}
+    page_widths = {info["page"]: info["width"] for info in pages}
+
+    if not len(all_lines):
         return {"title": "", "outline": []}
+    # Style histogram over every line, before the title lines are excluded
+    styles, style_counts = build_style_table(all_lines)
     
     # --- TITLE IDENTIFICATION (remains mostly the same) ---
     page_0_height = page_heights.get(0, 1000)
-    page_0_lines_top_half = sorted(
-        [line for line in all_lines if line["page"] == 0 and line["y0"] < page_0_height / 2],
-        key=lambda x: (x["column"], x["y0"])
-    )
+    top_half = all_lines[(all_lines["page"] == 0) & (all_lines["y0"] < page_0_height / 2)]
+    top_half = top_half[np.lexsort((top_half["y0"], top_half["column"]))]
+    page_0_lines_top_half = [line_record(row, texts, styles) for row in top_half]
 
     doc_title = ""
     title_line_ids = set()
@@ -1481,7 +1778,7 @@ def process_pdf(pdf_path, ml_output_path=None):
             # Check if all fonts are basically same size (difference <1pt)
             if max_size_page_0 - min_size_page_0 < 1:
                 # fallback: find first bold & centered line (centered = x0 + x1 ≈ center of page)
-                page_width = doc[0].rect.width
+                page_width = page_widths[0]
                 center_x = page_width / 2
                 centered_bold_lines = [
                     line for line in page_0_lines_top_half
@@ -1536,51 +1833,42 @@ def process_pdf(pdf_path, ml_output_path=None):
 
     if title_line_ids:
         print(f"INFO: Identified title: '{doc_title}'. Excluding {len(title_line_ids)} lines from heading analysis.")
-        all_lines = [line for line in all_lines if line['id'] not in title_line_ids]
+        is_title_line = np.zeros(len(all_lines), dtype=bool)
+        for page_num, y0 in title_line_ids:
+            is_title_line |= (all_lines["page"] == page_num) & (all_lines["y0"] == y0)
+        all_lines = all_lines[~is_title_line]
 
     # --- HEADING IDENTIFICATION (NEW LOGIC) ---
 
     # 1. Determine the main body style of the document
-    non_bold_styles = [s for s, c in style_counts.items() if not s[1]]
-    if not non_bold_styles:
-        body_style = style_counts.most_common(1)[0][0] if style_counts else (10, False)
-    else:
-        body_style = Counter({s: style_counts[s] for s in non_bold_styles}).most_common(1)[0][0]
+    body_style = deduce_body_style(styles, style_counts)
     print(f"INFO: Deduced body text style: {body_style} (size, is_bold)")
 
     # 2. **NEW**: Check if page 0 contains any paragraph text
-    page_0_has_paragraphs = any(line['page'] == 0 and line['style'] == body_style for line in all_lines)
+    body_style_id = styles.index(body_style) if body_style in styles else -1
+    page_0_has_paragraphs = bool(np.any((all_lines["page"] == 0) & (all_lines["style"] == body_style_id)))
     if not page_0_has_paragraphs:
         print("INFO: Page 0 has no paragraph text. It will be ignored for heading extraction.")
 
     # 3. Filter for initial heading candidates based on style and simple heuristics
-    initial_candidates = []
-    for line in all_lines:
-        # **NEW**: Skip page 0 if it's determined to be a cover page
-        if not page_0_has_paragraphs and line['page'] == 0:
-            continue
-            
-        # A heading must be stylistically distinct from the body text
-        is_stylistically_distinct = (line['size'] > body_style[0]) or (line['is_bold'] and not body_style[1])
-        if not is_stylistically_distinct:
-            continue
-
-        # Basic text filters
-        text = line['text']
-        if not (3 < len(text) < 250): continue
-        if len(text.split()) > 25: continue # Exclude long lines
-        if re.fullmatch(r"[\d\W_]+", text): continue # Exclude lines with only numbers/symbols
-        if text.endswith(('.', ',', ';')) and len(text.split()) > 15: continue
-        
-        initial_candidates.append(line)
+    # A heading must be stylistically distinct from the body text
+    is_candidate = (all_lines["size"] > body_style[0]) | (all_lines["is_bold"] & (not body_style[1]))
+    # **NEW**: Skip page 0 if it's determined to be a cover page
+    if not page_0_has_paragraphs:
+        is_candidate &= all_lines["page"] != 0
+    initial_candidates = all_lines[is_candidate]
+    # Text filters run once per distinct text rather than once per line
+    candidate_text_ids = np.unique(initial_candidates["text"])
+    heading_text_ids = candidate_text_ids[np.array([is_heading_text(texts[t]) for t in candidate_text_ids], dtype=bool)]
+    initial_candidates = initial_candidates[np.isin(initial_candidates["text"], heading_text_ids)]
 
     # 4. **NEW**: Dynamically determine heading levels based on sorted styles
-    if not initial_candidates:
+    if not len(initial_candidates):
         return {"title": doc_title, "outline": []}
 
     # Get all unique styles from our candidates
     heading_styles = sorted(
-        list(set(c['style'] for c in initial_candidates)),
+        [styles[style_id] for style_id in np.unique(initial_candidates["style"])],
         key=lambda s: (-s[0], -s[1])  # Sort by size (desc), then by bold status (True first)
     )
 
@@ -1591,15 +1879,16 @@ def process_pdf(pdf_path, ml_output_path=None):
     for style, level in style_to_level_map.items():
         print(f"  - {level}: {style}")
 
-    # 5. Assign levels to all candidates
-    refined_headings = []
-    for cand in initial_candidates:
+    # 5. Assign levels to all candidates, in reading order (the sort is stable, like sorted())
+    order = np.lexsort((initial_candidates["y0"], initial_candidates["column"], initial_candidates["page"]))
+    sorted_headings = []
+    for row in initial_candidates[order]:
+        cand = line_record(row, texts, styles)
         cand['level'] = style_to_level_map.get(cand['style'])
         if cand['level']:
-             refined_headings.append(cand)
+             sorted_headings.append(cand)
              
     # --- POST-PROCESSING (Merging and Final Filtering) ---
-    sorted_headings = sorted(refined_headings, key=lambda x: (x['page'], x['column'], x['y0']))
     
     outline = []
     i = 0
@@ -1652,29 +1941,164 @@ def process_pdf(pdf_path, ml_output_path=None):
     return {"title": doc_title, "outline": outline}
 
 
-def process_all_pdfs(input_dir, output_dir):
+# --- Batch Processing ---
+BATCH_FILE_TIMEOUT = 300     # seconds one PDF may take before it is abandoned as failed
+
+class FileTimeoutError(BaseException):
+    # BaseException so library code catching Exception (find_tables does) cannot swallow it
+    pass
+
+def _raise_file_timeout(signum, frame):
+    raise FileTimeoutError()
+
+def output_path_for(pdf_path, output_dir):
+    """Deterministic output location: <output_dir>/<pdf name without extension>.json."""
+    return os.path.join(output_dir, os.path.splitext(os.path.basename(pdf_path))[0] + ".json")
+
+def process_one_pdf(pdf_path, output_dir, profile=DEFAULT_PROFILE, timeout=BATCH_FILE_TIMEOUT, quiet=False):
     """
-    Processes all PDF files in a given directory.
+    Processes a single PDF for a batch run and writes its JSON output atomically.
+    Never raises: failures (including exceeding `timeout` seconds) are returned
+    in the result so one bad file cannot take down the batch.
     """
+    start_time = time.time()
+    result = {"file": os.path.basename(pdf_path), "output": output_path_for(pdf_path, output_dir), "pages": 0}
+    tmp_path = result["output"] + f".{os.getpid()}.tmp"
+    # SIGALRM only exists on Unix; elsewhere files run without a timeout
+    use_alarm = bool(timeout) and hasattr(signal, "SIGALRM")
+    if use_alarm:
+        previous_handler = signal.signal(signal.SIGALRM, _raise_file_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        report = {}
+        if quiet:
+            with contextlib.redirect_stdout(io.StringIO()):
+                output_data = process_pdf(pdf_path, profile=profile, report=report)
+        else:
+            output_data = process_pdf(pdf_path, profile=profile, report=report)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(output_data, f, indent=4)
+        os.replace(tmp_path, result["output"])
+        result.update(ok=True, pages=report.get("page_count", 0))
+    except FileTimeoutError:
+        result.update(ok=False, error=f"timed out after {timeout}s")
+    except Exception as e:
+        result.update(ok=False, error=f"{type(e).__name__}: {e}")
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous_handler)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    result["seconds"] = round(time.time() - start_time, 3)
+    return result
+
+def _process_one_pdf_task(args):
+    return process_one_pdf(*args, quiet=True)
+
+def run_batch_in_pool(tasks, workers):
+    """
+    Yields process_one_pdf results for `tasks` from `workers` processes, with at
+    most one file in flight per worker. A worker that dies hard (MuPDF crash,
+    OOM killer) breaks the pool: the files in flight are reported as failed and
+    a fresh pool carries on with the rest.
+    """
+    pending = list(reversed(tasks))
+    while pending:
+        in_flight = {}
+        with ProcessPoolExecutor(workers) as executor:
+            try:
+                while pending or in_flight:
+                    while pending and len(in_flight) < workers:
+                        future = executor.submit(_process_one_pdf_task, pending[-1])
+                        in_flight[future] = (pending.pop(), time.time())
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+                        del in_flight[future]
+            except BrokenProcessPool:
+                print(f"--- A worker process died; failing {len(in_flight)} in-flight file(s) and restarting the pool. ---")
+                for future, (task, submitted) in in_flight.items():
+                    if future.done() and future.exception() is None:
+                        yield future.result()
+                        continue
+                    pdf_path, output_dir = task[0], task[1]
+                    yield {"file": os.path.basename(pdf_path), "output": output_path_for(pdf_path, output_dir), "pages": 0,
+                           "ok": False, "error": "worker process died", "seconds": round(time.time() - submitted, 3)}
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+def print_batch_report(summary):
+    print("=== Batch report ===")
+    print(f"Files: {summary['files']} ({summary['succeeded']} succeeded, {summary['failed']} failed), "
+          f"pages: {summary['pages']}, workers: {summary['workers']}, profile: {summary['profile']}")
+    print(f"Wall time: {summary['wall_time_s']:.2f}s | {summary['files_per_s']:.2f} files/s | "
+          f"{summary['pages_per_s']:.1f} pages/s")
+    print(f"Per-file time: p50 {summary['p50_file_s']:.2f}s, p95 {summary['p95_file_s']:.2f}s, "
+          f"max {summary['max_file_s']:.2f}s")
+    for failure in summary["failures"]:
+        print(f"  FAILED {failure['file']}: {failure['error']}")
+
+def process_all_pdfs(input_dir, output_dir, profile=DEFAULT_PROFILE, workers=None, timeout=BATCH_FILE_TIMEOUT):
+    """
+    Processes all PDF files in a given directory with the given extraction
+    profile, across `workers` processes (default: one per CPU core). Each PDF
+    is written to <output_dir>/<name>.json; a file that fails, runs past
+    `timeout` seconds or kills its worker process is reported and skipped
+    without affecting the others.
+    Prints and returns an aggregate throughput report.
+    """
+    if profile not in EXTRACTION_PROFILES:
+        raise ValueError(f"Unknown extraction profile '{profile}'. Expected one of {EXTRACTION_PROFILES}.")
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    for filename in os.listdir(input_dir):
-        if filename.lower().endswith(".pdf"):
-            pdf_path = os.path.join(input_dir, filename)
-            print(f"--- Processing {filename} ---")
-            start_time = time.time()
-            
-            base_filename = os.path.splitext(filename)[0]
-            output_path = os.path.join(output_dir, base_filename + ".json")
-            
-            output_data = process_pdf(pdf_path)
-            
-            with open(output_path, 'w', encoding='utf-8') as f:
-                json.dump(output_data, f, indent=4)
-            end_time = time.time()
-            print(f"--- Finished {filename} in {end_time - start_time:.2f} seconds. ---")
+    pdf_paths = [os.path.join(input_dir, filename) for filename in sorted(os.listdir(input_dir))
+                 if filename.lower().endswith(".pdf")]
+    workers = max(1, min(workers or os.cpu_count() or 1, len(pdf_paths) or 1))
+    start_time = time.time()
+    results = []
+    if workers == 1:
+        for pdf_path in pdf_paths:
+            print(f"--- Processing {os.path.basename(pdf_path)} ---")
+            result = process_one_pdf(pdf_path, output_dir, profile, timeout)
+            results.append(result)
+            print(f"--- Finished {result['file']} in {result['seconds']:.2f} seconds. ---")
+    else:
+        tasks = [(pdf_path, output_dir, profile, timeout) for pdf_path in pdf_paths]
+        for result in run_batch_in_pool(tasks, workers):
+            results.append(result)
+            status = "Finished" if result["ok"] else "FAILED"
+            print(f"--- [{len(results)}/{len(tasks)}] {status} {result['file']} in {result['seconds']:.2f} seconds. ---")
+    wall_time = time.time() - start_time
+
+    file_times = [r["seconds"] for r in results]
+    pages = sum(r["pages"] for r in results)
+    summary = {
+        "profile": profile,
+        "workers": workers,
+        "files": len(results),
+        "succeeded": sum(1 for r in results if r["ok"]),
+        "failed": sum(1 for r in results if not r["ok"]),
+        "pages": pages,
+        "wall_time_s": round(wall_time, 3),
+        "files_per_s": round(len(results) / wall_time, 3) if wall_time else 0.0,
+        "pages_per_s": round(pages / wall_time, 3) if wall_time else 0.0,
+        "p50_file_s": percentile(file_times, 50),
+        "p95_file_s": percentile(file_times, 95),
+        "max_file_s": max(file_times, default=0.0),
+        "failures": sorted(({"file": r["file"], "error": r["error"]} for r in results if not r["ok"]),
+                           key=lambda f: f["file"]),
+    }
+    print_batch_report(summary)
+    return summary
 
 
 # Example usage:
-# process_all_pdfs('path/to/your/pdfs', 'path/to/your/output')
\ No newline at end of file
+# process_all_pdfs('path/to/your/pdfs', 'path/to/your/output')
+# process_all_pdfs('path/to/your/pdfs', 'path/to/your/output', profile="balanced", workers=32, timeout=120)
+# process_pdf('path/to/manual.pdf', workers=32)  # one large document, sharded by page range
@@ -0,0 +1,141 @@
+# Backend/sections.py
+
+import os
+import re
+import logging
+from typing import Any, Dict, List, Optional, Sequence
+
+from rapidfuzz import fuzz
+
+from token_budget import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# --- Section Chunking Settings ---
+SECTION_CHUNKING_ENABLED = os.getenv("SECTION_CHUNKING_ENABLED", "true").lower() in ("1", "true", "yes")
+# Multi-page sections above this size are split at page boundaries
+SECTION_MAX_TOKENS = int(os.getenv("SECTION_MAX_TOKENS", 3000))
+# Minimum fuzzy score for a top_sections entry to be tied to an outline heading
+SECTION_MATCH_THRESHOLD = int(os.getenv("SECTION_MATCH_THRESHOLD", 80))
+
+
+def locate_heading(page_text: str, heading: str, start: int = 0) -> Optional[int]:
+    """Character offset of a heading in a page's text, tolerant of line breaks and spacing differences."""
+    words = heading.split()
+    if not words:
+        return None
+    match = re.compile(r"\s+".join(re.escape(w) for w in words), re.IGNORECASE).search(page_text, start)
+    return match.start() if match else None
+
+
+def build_sections(pages: Sequence[str], outline: List[Dict[str, Any]], title: str = "") -> List[Dict[str, Any]]:
+    """
+    Splits a document into heading-delimited sections from its outline
+    (1-based "page" numbers). Sections are stored as boundaries, not text:
+    {title, level, page_start, start, page_end, end} where start/end are
+    character offsets into the first and last page. Documents without a usable
+    outline get one section per page.
+    """
+    boundaries = []
+    for heading in outline:
+        page_idx = heading.get("page", 0) - 1
+        if not 0 <= page_idx < len(pages):
+            continue
+        last_page, last_offset = boundaries[-1][:2] if boundaries else (-1, -1)
+        search_from = last_offset + 1 if last_page == page_idx else 0
+        offset = locate_heading(pages[page_idx], heading["text"], search_from)
+        if offset is None:
+            # Heading text not in the extracted page text (e.g. drawn as an image): start at the page top
+            if last_page == page_idx:
+                continue
+            offset = 0
+        if (page_idx, offset) <= (last_page, last_offset):
+            continue
+        boundaries.append((page_idx, offset, heading["text"], heading.get("level", "H1")))
+
+    if not boundaries:
+        return [{"title": f"Page {n}", "level": "page", "page_start": n, "start": 0, "page_end": n, "end": len(text)}
+                for n, text in enumerate(pages, start=1)]
+
+    sections = []
+    first_page, first_offset = boundaries[0][:2]
+    if first_page > 0 or pages[0][:first_offset].strip():
+        sections.append({"title": title or "Front Matter", "level": "H0", "page_start": 1, "start": 0,
+                         "page_end": first_page + 1, "end": first_offset})
+    for n, (page_idx, offset, heading, level) in enumerate(boundaries):
+        if n + 1 < len(boundaries):
+            end_page, end_offset = boundaries[n + 1][:2]
+        else:
+            end_page, end_offset = len(pages) - 1, len(pages[-1])
+        sections.append({"title": heading, "level": level, "page_start": page_idx + 1, "start": offset,
+                         "page_end": end_page + 1, "end": end_offset})
+    return _split_oversized(pages, sections)
+
+
+def _split_oversized(pages: Sequence[str], sections: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    result = []
+    for section in sections:
+        if section["page_start"] == section["page_end"] or estimate_tokens(section_text(pages, section)) <= SECTION_MAX_TOKENS:
+            result.append(section)
+            continue
+        part, part_no = dict(section), 1
+        for page_num in range(section["page_start"], section["page_end"]):
+            part_end = {**part, "page_end": page_num, "end": len(pages[page_num - 1])}
+            if estimate_tokens(section_text(pages, part_end)) >= SECTION_MAX_TOKENS:
+                result.append({**part_end, "title": f"{section['title']} (part {part_no})"})
+                part, part_no = {**section, "page_start": page_num + 1, "start": 0}, part_no + 1
+        result.append({**part, "title": f"{section['title']} (part {part_no})"} if part_no > 1 else part)
+    return result
+
+
+def section_text(pages: Sequence[str], section: Dict[str, Any]) -> str:
+    first, last = section["page_start"] - 1, section["page_end"] - 1
+    if first == last:
+        return pages[first][section["start"]:section["end"]]
+    parts = [pages[first][section["start"]:]]
+    parts.extend(pages[first + 1:last])
+    parts.append(pages[last][:section["end"]])
+    return "".join(parts)
+
+
+def materialize_sections(doc: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """A document's sections with their text filled in from its pages."""
+    return [{**section, "text": section_text(doc["pages"], section)} for section in doc.get("sections", [])]
+
+
+def _best_title_match(title: str, sections: List[Dict[str, Any]]):
+    """(score, section) of the closest heading; token_set_ratio ties (subset titles score 100) go to the closer plain ratio."""
+    scored = [(fuzz.token_set_ratio(title, s["title"]), fuzz.ratio(title, s["title"]), s) for s in sections]
+    score, _, best = max(scored, key=lambda item: item[:2])
+    return score, best
+
+
+def ground_top_sections(analysis: Dict[str, Any], documents: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Ties each top_sections entry to a real outline heading. The entry's
+    page_number (copied from the page markers) is trusted: the heading is the
+    best fuzzy title match among the sections containing that page. Only
+    entries without a usable page fall back to matching the whole document,
+    and only those get a page_number filled in. Adds `heading`,
+    `heading_level` and `heading_page` so the frontend can jump to it.
+    """
+    sections_by_doc = {doc["name"]: doc.get("sections", []) for doc in documents}
+    for entry in analysis.get("top_sections", []):
+        sections = [s for s in sections_by_doc.get(entry.get("document"), []) if s["level"] != "page"]
+        if not sections:
+            continue
+        title = entry.get("section_title", "")
+        page = entry.get("page_number")
+        containing = [s for s in sections if isinstance(page, int) and s["page_start"] <= page <= s["page_end"]]
+        if containing:
+            _, best = _best_title_match(title, containing)
+        else:
+            score, best = _best_title_match(title, sections)
+            if score < SECTION_MATCH_THRESHOLD:
+                continue
+            if not isinstance(page, int):
+                entry["page_number"] = best["page_start"]
+        entry["heading"] = best["title"]
+        entry["heading_level"] = best["level"]
+        entry["heading_page"] = best["page_start"]
+    return analysis
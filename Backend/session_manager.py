@@ -13,6 +13,7 @@ SESSION_META_PREFIX = "session:meta:"
 SESSION_HISTORY_PREFIX = "session:history:"
 SESSION_ANALYSIS_PREFIX = "session:analysis:"
 SESSION_FILES_PREFIX = "session:files:"
+SESSION_CHAT_SUMMARY_PREFIX = "session:chat_summary:"
 USER_PREFIX = "user:"
 
 logging.basicConfig(level=logging.INFO)
@@ -135,6 +136,24 @@ def add_message_to_history(session_id: str, message: Dict[str, str]):
     redis.rpush(history_key, json.dumps(message))
 
 
+def get_chat_summary(session_id: str) -> Dict[str, Any]:
+    """Returns the rolling summary of older chat turns and how many messages it covers."""
+    redis = get_redis_client()
+    if not redis:
+        return {"summary": "", "covered": 0}
+    summary_key = f"{SESSION_CHAT_SUMMARY_PREFIX}{session_id}"
+    data = redis.hgetall(summary_key)
+    return {"summary": data.get("summary", ""), "covered": int(data.get("covered", 0))}
+
+
+def set_chat_summary(session_id: str, summary: str, covered: int):
+    redis = get_redis_client()
+    if not redis:
+        return
+    summary_key = f"{SESSION_CHAT_SUMMARY_PREFIX}{session_id}"
+    redis.hset(summary_key, mapping={"summary": summary, "covered": covered})
+
+
 def get_all_sessions_metadata_for_user(user_id: str) -> List[Dict[str, Any]]:
     redis = get_redis_client()
     if not redis:
@@ -190,6 +209,13 @@ def update_session(session_id: str, analysis_result: Dict[str, Any]):
         analysis_key = f"{SESSION_ANALYSIS_PREFIX}{session_id}"
         pipe.set(analysis_key, json.dumps(analysis_result))
 
+        # Files (re-analysis may add documents or re-point them at new content)
+        file_path_map = metadata.get("file_path_map", {})
+        if file_path_map:
+            files_key = f"{SESSION_FILES_PREFIX}{session_id}"
+            pipe.delete(files_key)
+            pipe.rpush(files_key, *file_path_map.values())
+
         # ✅ Do NOT delete chat history
         pipe.execute()
 
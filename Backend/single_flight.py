@@ -0,0 +1,133 @@
+# Backend/single_flight.py
+
+import os
+import json
+import uuid
+import asyncio
+import hashlib
+import logging
+import functools
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import redis as redis_lib
+
+from redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+# --- Constants for Redis Keys ---
+SINGLE_FLIGHT_LOCK_PREFIX = "singleflight:lock:"
+SINGLE_FLIGHT_RESULT_PREFIX = "singleflight:result:"
+
+# --- Settings ---
+# "local" coalesces within one process; "redis" also coalesces across uvicorn workers
+SINGLE_FLIGHT_MODE = os.getenv("SINGLE_FLIGHT_MODE", "local").lower()
+SINGLE_FLIGHT_LOCK_TTL = int(os.getenv("SINGLE_FLIGHT_LOCK_TTL", 600))
+SINGLE_FLIGHT_RESULT_TTL = int(os.getenv("SINGLE_FLIGHT_RESULT_TTL", 30))
+SINGLE_FLIGHT_POLL_INTERVAL = 0.2
+
+# Deletes the lock only if it is still held by the caller
+_RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def make_flight_key(*parts: Any) -> str:
+    """Hashes JSON-serializable call arguments into a stable single-flight key."""
+    canonical = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """
+    Collapses duplicate concurrent calls: the first caller for a key runs the
+    work, every other caller with the same key awaits that same future. In
+    "redis" mode a lock in Redis extends this across processes, with followers
+    picking up the leader's JSON result from Redis. Results rejected by
+    `publish_if` (e.g. error fallbacks) are returned to the leader's own
+    waiters but never published to other workers.
+    """
+
+    def __init__(self, namespace: str, mode: str = SINGLE_FLIGHT_MODE,
+                 publish_if: Optional[Callable[[Any], bool]] = None):
+        self.namespace = namespace
+        self.mode = mode
+        self.publish_if = publish_if
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        existing = self._inflight.get(key)
+        if existing is not None:
+            self.coalesced += 1
+            return await asyncio.shield(existing)
+
+        work = self._run_distributed(key, fn) if self.mode == "redis" else fn()
+        task = asyncio.ensure_future(work)
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shield so a disconnecting caller does not cancel the work for everyone else
+        return await asyncio.shield(task)
+
+    async def _run_distributed(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        redis = get_redis_client()
+        if not redis:
+            return await fn()
+        lock_key = f"{SINGLE_FLIGHT_LOCK_PREFIX}{self.namespace}:{key}"
+        result_key = f"{SINGLE_FLIGHT_RESULT_PREFIX}{self.namespace}:{key}"
+        token = str(uuid.uuid4())
+        try:
+            while True:
+                cached = redis.get(result_key)
+                if cached is not None:
+                    self.coalesced += 1
+                    return json.loads(cached)
+                if redis.set(lock_key, token, nx=True, ex=SINGLE_FLIGHT_LOCK_TTL):
+                    break
+                # Another worker is leading; wait for its result or for the lock to go away
+                while redis.exists(lock_key) and not redis.exists(result_key):
+                    await asyncio.sleep(SINGLE_FLIGHT_POLL_INTERVAL)
+        except redis_lib.exceptions.RedisError as e:
+            logger.warning(f"Single-flight lock unavailable for {self.namespace}, running locally: {e}")
+            return await fn()
+
+        try:
+            result = await fn()
+            if self.publish_if is not None and not self.publish_if(result):
+                return result
+            try:
+                redis.set(result_key, json.dumps(result, ensure_ascii=False), ex=SINGLE_FLIGHT_RESULT_TTL)
+            except (TypeError, ValueError, redis_lib.exceptions.RedisError) as e:
+                logger.warning(f"Could not publish single-flight result for {self.namespace}: {e}")
+            return result
+        finally:
+            try:
+                redis.eval(_RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+            except redis_lib.exceptions.RedisError as e:
+                logger.warning(f"Could not release single-flight lock for {self.namespace}: {e}")
+
+
+def single_flight(namespace: str, key_func: Optional[Callable[..., Optional[str]]] = None,
+                  publish_if: Optional[Callable[[Any], bool]] = None):
+    """
+    Decorator that coalesces concurrent calls of an async function with the same key.
+    `key_func` receives the call arguments; by default all arguments are hashed.
+    Returning None from `key_func` skips coalescing for that call.
+    `publish_if` decides whether a result may be shared with other workers in "redis" mode.
+    """
+    def decorator(fn):
+        flight = SingleFlight(namespace, publish_if=publish_if)
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            key = key_func(*args, **kwargs) if key_func else make_flight_key(args, kwargs)
+            if key is None:
+                return await fn(*args, **kwargs)
+            return await flight.do(key, lambda: fn(*args, **kwargs))
+
+        wrapper.single_flight = flight
+        return wrapper
+    return decorator
@@ -0,0 +1,97 @@
+# Backend/text_preprocessor.py
+
+import os
+import re
+import logging
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Tuple
+
+from token_budget import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# --- Preprocessing Settings ---
+PROMPT_PREPROCESSING_ENABLED = os.getenv("PROMPT_PREPROCESSING_ENABLED", "true").lower() in ("1", "true", "yes")
+# Bump whenever normalization changes, so cached page texts are rebuilt
+PREPROCESSOR_VERSION = "2"
+# A line repeated on at least this share of pages (and at least 3 pages) is boilerplate
+BOILERPLATE_PAGE_SHARE = float(os.getenv("BOILERPLATE_PAGE_SHARE", 0.5))
+BOILERPLATE_MIN_PAGES = 3
+# Only the first/last line of a page is considered, so repeated body text (e.g. "Ingredients:")
+# and numbers inside the page (table cells) are kept
+BOILERPLATE_EDGE_LINES = 1
+
+_PAGE_NUMBER_LINE = re.compile(r"^\s*(?:page\s+)?\d{1,4}(?:\s*(?:of|/)\s*\d{1,4})?\s*$", re.IGNORECASE)
+_HYPHEN_BREAK = re.compile(r"(\w)-\n(?=[a-z])")
+_INLINE_SPACE = re.compile(r"[ \t ]+")
+_BLANK_LINES = re.compile(r"\n{3,}")
+
+
+def _line_pattern(text: str) -> re.Pattern:
+    """Matches a header/footer block as whole line(s), whatever whitespace PyMuPDF put between its words."""
+    return re.compile(r"^[ \t]*" + r"\s+".join(re.escape(w) for w in text.split()) + r"[ \t]*$\n?", re.MULTILINE)
+
+
+def _edge_lines(lines: List[str]) -> List[str]:
+    return lines[:BOILERPLATE_EDGE_LINES] + lines[BOILERPLATE_EDGE_LINES:][-BOILERPLATE_EDGE_LINES:]
+
+
+def _drop_edge_lines(text: str, is_droppable) -> str:
+    """Removes the first/last content lines of a page for which is_droppable(stripped line) holds."""
+    lines = text.split("\n")
+    edges = set(_edge_lines([n for n, line in enumerate(lines) if line.strip()]))
+    return "\n".join(line for n, line in enumerate(lines) if n not in edges or not is_droppable(line.strip()))
+
+
+def strip_page_numbers(text: str) -> str:
+    """Drops a page-number line at the top or bottom of a page; numbers elsewhere are content."""
+    return _drop_edge_lines(text, _PAGE_NUMBER_LINE.match)
+
+
+def find_boilerplate_lines(pages: List[str]) -> set:
+    """
+    Lines repeated at the top or bottom of many pages. Complements the
+    positional detection, which skips documents shorter than four pages.
+    """
+    page_count = len(pages)
+    min_pages = max(BOILERPLATE_MIN_PAGES, int(page_count * BOILERPLATE_PAGE_SHARE))
+    if page_count < min_pages:
+        return set()
+    line_pages = Counter()
+    for text in pages:
+        lines = [line.strip() for line in text.split("\n") if line.strip()]
+        line_pages.update({line for line in _edge_lines(lines) if len(line) > 5})
+    return {line for line, count in line_pages.items() if count >= min_pages}
+
+
+def strip_headers_and_footers(text: str, header_patterns: Iterable[re.Pattern]) -> str:
+    for pattern in header_patterns:
+        text = pattern.sub("", text)
+    return _HYPHEN_BREAK.sub(r"\1", text)
+
+
+def normalize_page(text: str, boilerplate: set) -> str:
+    if boilerplate:
+        text = _drop_edge_lines(text, boilerplate.__contains__)
+    text = "\n".join(_INLINE_SPACE.sub(" ", line).strip() for line in text.split("\n"))
+    return _BLANK_LINES.sub("\n\n", text).strip() + "\n"
+
+
+def normalize_pages(pages: List[str], headers_and_footers: set) -> Tuple[List[str], Dict[str, Any]]:
+    """
+    Cleans extracted page text before it reaches any prompt: strips running
+    headers/footers (from round1a's detect_headers_and_footers) and other
+    boilerplate repeated across pages, drops page-number lines at the top or
+    bottom of a page, joins words hyphenated across line breaks and collapses
+    whitespace. Returns the cleaned pages and {raw_tokens, clean_tokens,
+    boilerplate_lines} for reporting.
+    """
+    header_patterns = [_line_pattern(text) for text in headers_and_footers]
+    stripped = [strip_page_numbers(strip_headers_and_footers(text, header_patterns)) for text in pages]
+    boilerplate = find_boilerplate_lines(stripped)
+    cleaned = [normalize_page(text, boilerplate) for text in stripped]
+    raw_tokens = sum(estimate_tokens(text) for text in pages)
+    clean_tokens = sum(estimate_tokens(text) for text in cleaned)
+    stats = {"raw_tokens": raw_tokens, "clean_tokens": clean_tokens,
+             "boilerplate_lines": len(headers_and_footers) + len(boilerplate)}
+    return cleaned, stats
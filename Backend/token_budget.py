@@ -0,0 +1,172 @@
+# Backend/token_budget.py
+
+import os
+import math
+import threading
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GEMINI_MODEL = "gemini-1.5-flash"
+
+# --- Model Input Limits (tokens) ---
+MODEL_INPUT_TOKEN_LIMITS = {
+    "gemini-1.5-flash": 1_048_576,
+    "gemini-1.5-flash-8b": 1_048_576,
+    "gemini-1.5-pro": 2_097_152,
+    "gemini-2.0-flash": 1_048_576,
+    "gemini-2.0-flash-lite": 1_048_576,
+    "gemini-2.5-flash": 1_048_576,
+    "gemini-2.5-flash-lite": 1_048_576,
+    "gemini-2.5-pro": 1_048_576,
+}
+# Unknown models get a conservative window rather than a guess at a large one
+DEFAULT_INPUT_TOKEN_LIMIT = int(os.getenv("GEMINI_DEFAULT_INPUT_TOKEN_LIMIT", 32_768))
+
+# --- Budget Settings ---
+# Share of the model window a prompt may use; the rest is headroom for estimation error
+PROMPT_BUDGET_FRACTION = float(os.getenv("PROMPT_BUDGET_FRACTION", 0.8))
+# Optional hard cap on any prompt, to keep per-request cost predictable
+GEMINI_PROMPT_TOKEN_BUDGET = int(os.getenv("GEMINI_PROMPT_TOKEN_BUDGET", 0)) or None
+# Segments are trimmed rather than dropped when at least this much budget is left for them
+PACK_MIN_TRIM_TOKENS = int(os.getenv("PACK_MIN_TRIM_TOKENS", 200))
+
+# --- Estimator Settings ---
+INITIAL_CHARS_PER_TOKEN = 4.0
+# Weight of each new observation in the calibrated chars-per-token ratio
+ESTIMATOR_SMOOTHING = 0.1
+MIN_CHARS_PER_TOKEN, MAX_CHARS_PER_TOKEN = 2.0, 6.0
+
+
+def current_model() -> str:
+    return os.environ.get("GEMINI_MODEL", DEFAULT_GEMINI_MODEL)
+
+
+def model_input_limit(model: Optional[str] = None) -> int:
+    model = model or current_model()
+    if model in MODEL_INPUT_TOKEN_LIMITS:
+        return MODEL_INPUT_TOKEN_LIMITS[model]
+    # Versioned names such as "gemini-2.5-flash-001" or "...-preview-05-20"
+    for name in sorted(MODEL_INPUT_TOKEN_LIMITS, key=len, reverse=True):
+        if model.startswith(name):
+            return MODEL_INPUT_TOKEN_LIMITS[name]
+    return DEFAULT_INPUT_TOKEN_LIMIT
+
+
+def prompt_budget(model: Optional[str] = None) -> int:
+    """Largest prompt (in estimated tokens) any caller should build for the configured model."""
+    budget = int(model_input_limit(model) * PROMPT_BUDGET_FRACTION)
+    return min(budget, GEMINI_PROMPT_TOKEN_BUDGET) if GEMINI_PROMPT_TOKEN_BUDGET else budget
+
+
+def payload_text_chars(payload: Dict[str, Any]) -> int:
+    """Characters of prompt text in a generateContent payload (schemas and framing excluded)."""
+    chars = 0
+    for content in payload.get("contents", []):
+        for part in content.get("parts", []):
+            chars += len(part.get("text", ""))
+    return chars
+
+
+class TokenEstimator:
+    """
+    Estimates tokens from character counts, calibrated per model against the
+    promptTokenCount Gemini reports, so later estimates track the real tokenizer.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._chars_per_token: Dict[str, float] = {}
+        self._stats: Dict[str, Dict[str, Any]] = {}
+
+    def chars_per_token(self, model: Optional[str] = None) -> float:
+        return self._chars_per_token.get(model or current_model(), INITIAL_CHARS_PER_TOKEN)
+
+    def estimate(self, text: str, model: Optional[str] = None) -> int:
+        return max(1, math.ceil(len(text) / self.chars_per_token(model)))
+
+    def estimate_payload(self, payload: Dict[str, Any], model: Optional[str] = None) -> int:
+        return max(1, math.ceil(payload_text_chars(payload) / self.chars_per_token(model)))
+
+    def record(self, model: str, prompt_chars: int, estimated: int, actual: Optional[int]):
+        """Records the real prompt token count of a response against the estimate made before sending."""
+        if not actual or prompt_chars <= 0:
+            return
+        with self._lock:
+            observed = min(MAX_CHARS_PER_TOKEN, max(MIN_CHARS_PER_TOKEN, prompt_chars / actual))
+            previous = self._chars_per_token.get(model, INITIAL_CHARS_PER_TOKEN)
+            self._chars_per_token[model] = previous + ESTIMATOR_SMOOTHING * (observed - previous)
+            stats = self._stats.setdefault(model, {"samples": 0, "estimated_tokens": 0, "actual_tokens": 0, "abs_error_tokens": 0})
+            stats["samples"] += 1
+            stats["estimated_tokens"] += estimated
+            stats["actual_tokens"] += actual
+            stats["abs_error_tokens"] += abs(estimated - actual)
+            if estimated < actual * 0.8:
+                logger.info(f"Prompt estimate {estimated} was well under the actual {actual} tokens for {model}.")
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            models = {}
+            for model, stats in self._stats.items():
+                models[model] = {
+                    **stats,
+                    "chars_per_token": round(self._chars_per_token.get(model, INITIAL_CHARS_PER_TOKEN), 3),
+                    "mean_abs_error_pct": round(100.0 * stats["abs_error_tokens"] / max(1, stats["actual_tokens"]), 2),
+                }
+        return {"model": current_model(), "input_limit": model_input_limit(), "prompt_budget": prompt_budget(), "models": models}
+
+
+# This variable will hold the single estimator instance
+token_estimator: Optional[TokenEstimator] = None
+
+
+def get_token_estimator() -> TokenEstimator:
+    global token_estimator
+    if token_estimator is None:
+        token_estimator = TokenEstimator()
+    return token_estimator
+
+
+def estimate_tokens(text: str) -> int:
+    return get_token_estimator().estimate(text)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    max_chars = int(max_tokens * get_token_estimator().chars_per_token())
+    return text if len(text) <= max_chars else text[:max_chars] + " ..."
+
+
+# ==============================================================================
+# Context Packer
+# ==============================================================================
+def make_segment(text: str, priority: int = 0, trimmable: bool = True) -> Dict[str, Any]:
+    """A piece of prompt context. Lower priority values are packed first."""
+    return {"text": text, "priority": priority, "trimmable": trimmable, "tokens": estimate_tokens(text)}
+
+
+def pack_segments(segments: List[Dict[str, Any]], budget: int) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Greedily fits segments into `budget` tokens in priority order (ties keep
+    their input order). A trimmable segment that does not fit is cut down to the
+    remaining budget if at least PACK_MIN_TRIM_TOKENS remain. Returns
+    (packed segments in their original order, overflow segments).
+    """
+    order = sorted(range(len(segments)), key=lambda i: (segments[i]["priority"], i))
+    packed, overflow, used = {}, [], 0
+    for i in order:
+        segment = segments[i]
+        remaining = budget - used
+        if segment["tokens"] <= remaining:
+            packed[i] = segment
+            used += segment["tokens"]
+        elif segment["trimmable"] and remaining >= PACK_MIN_TRIM_TOKENS:
+            text = truncate_to_tokens(segment["text"], remaining - 1)
+            packed[i] = {**segment, "text": text, "tokens": estimate_tokens(text), "trimmed": True}
+            used += packed[i]["tokens"]
+            overflow.append(segment)
+        else:
+            overflow.append(segment)
+    if overflow:
+        logger.info(f"Context packer kept {len(packed)} of {len(segments)} segments (~{used}/{budget} tokens).")
+    return [packed[i] for i in sorted(packed)], overflow
@@ -0,0 +1,97 @@
+# Backend/token_provider.py
+
+import os
+import asyncio
+import logging
+import datetime
+from typing import Optional
+
+import google.auth
+import google.auth.transport.requests
+
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+GOOGLE_CLOUD_SCOPES = ["https://www.googleapis.com/auth/cloud-platform"]
+# Start a background refresh once the token is this close to expiring...
+TOKEN_SOFT_REFRESH_MARGIN = int(os.getenv("TOKEN_SOFT_REFRESH_MARGIN", 300))
+# ...and block callers on a refresh once it is this close (or already expired).
+TOKEN_HARD_REFRESH_MARGIN = int(os.getenv("TOKEN_HARD_REFRESH_MARGIN", 60))
+
+
+class ServiceAccountTokenProvider:
+    """
+    Loads service account credentials once and caches the access token until
+    shortly before it expires. Refreshes run in a worker thread so the blocking
+    OAuth round trip never stalls the event loop, and concurrent callers share
+    a single in-flight refresh.
+    """
+
+    def __init__(self, credentials_path: Optional[str], scopes: Optional[list] = None):
+        self.credentials_path = credentials_path
+        self.scopes = scopes or GOOGLE_CLOUD_SCOPES
+        self._credentials = None
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    def _seconds_until_expiry(self) -> float:
+        creds = self._credentials
+        if creds is None or not creds.token:
+            return 0.0
+        if creds.expiry is None:
+            # Credentials without an expiry never need refreshing
+            return float("inf")
+        # google-auth stores expiry as a naive UTC datetime
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        return (creds.expiry - now).total_seconds()
+
+    def _refresh_sync(self):
+        """Blocking part of the refresh; always runs off the event loop."""
+        if self._credentials is None:
+            self._credentials, _ = google.auth.load_credentials_from_file(self.credentials_path, scopes=self.scopes)
+            logger.info("✅ Loaded service account credentials.")
+        self._credentials.refresh(google.auth.transport.requests.Request())
+        return self._credentials.token
+
+    def _ensure_refresh(self) -> asyncio.Task:
+        if self._refresh_task is None or self._refresh_task.done():
+            loop = asyncio.get_running_loop()
+            self._refresh_task = asyncio.ensure_future(loop.run_in_executor(None, self._refresh_sync))
+            self._refresh_task.add_done_callback(self._log_refresh_result)
+        return self._refresh_task
+
+    @staticmethod
+    def _log_refresh_result(task: asyncio.Task):
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error:
+            logger.error(f"❌ Failed to refresh service account token: {error}")
+
+    async def get_token(self) -> str:
+        remaining = self._seconds_until_expiry()
+        if remaining > TOKEN_SOFT_REFRESH_MARGIN:
+            return self._credentials.token
+        if remaining > TOKEN_HARD_REFRESH_MARGIN:
+            # Still valid: hand out the cached token and refresh in the background
+            self._ensure_refresh()
+            return self._credentials.token
+        # Shield the shared refresh so one cancelled caller does not cancel it for everyone
+        return await asyncio.shield(self._ensure_refresh())
+
+    async def warm_up(self):
+        """Fetches the first token ahead of traffic; failures are logged, not raised."""
+        try:
+            await self.get_token()
+        except Exception as e:
+            logger.error(f"❌ Could not warm up service account token: {e}")
+
+
+# This variable will hold the single token provider instance
+token_provider: Optional[ServiceAccountTokenProvider] = None
+
+
+def get_token_provider() -> ServiceAccountTokenProvider:
+    global token_provider
+    if token_provider is None:
+        token_provider = ServiceAccountTokenProvider(os.environ.get("GOOGLE_APPLICATION_CREDENTIALS"))
+    return token_provider
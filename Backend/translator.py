@@ -0,0 +1,162 @@
+# Backend/translator.py
+
+import os
+import json
+import asyncio
+import hashlib
+import logging
+from typing import Dict, List
+
+import redis as redis_lib
+
+from redis_client import get_redis_client
+from llm_client import call_gemini_api
+from rate_limiter import PRIORITY_BACKGROUND
+from token_budget import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+SUPPORTED_LANGUAGES = { "en": "English", "hi": "Hindi" }
+TRANSLATION_CACHE_PREFIX = "translation:"   # translation:<lang>:<sha256(text)> -> translation
+
+# --- Cache Settings ---
+TRANSLATION_CACHE_TTL_SECONDS = int(os.getenv("TRANSLATION_CACHE_TTL_SECONDS", 30 * 24 * 3600))
+
+# --- Batching Settings ---
+TRANSLATION_CHUNK_TOKENS = int(os.getenv("TRANSLATION_CHUNK_TOKENS", 2000))
+TRANSLATION_CHUNK_MAX_ITEMS = int(os.getenv("TRANSLATION_CHUNK_MAX_ITEMS", 40))
+TRANSLATION_CONCURRENCY = int(os.getenv("TRANSLATION_CONCURRENCY", 4))
+
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _cache_key(text: str, target_language: str) -> str:
+    return f"{TRANSLATION_CACHE_PREFIX}{target_language}:{_text_hash(text)}"
+
+
+async def translate_text_gemini(text: str, target_language: str) -> str:
+    language_name = SUPPORTED_LANGUAGES.get(target_language)
+    if not language_name: return "Error: Unsupported language."
+    prompt = f"Translate the following text into {language_name}. Provide only the translated text.\n\n---\n\n{text}"
+    payload = {"contents": [{"parts": [{"text": prompt}]}]}
+    response_json = await call_gemini_api(payload, priority=PRIORITY_BACKGROUND)
+    return response_json['candidates'][0]['content']['parts'][0]['text']
+
+
+# --- Per-string, per-language translation cache (entries expire after TRANSLATION_CACHE_TTL_SECONDS) ---
+def _get_cached_translations(texts: List[str], target_language: str) -> Dict[str, str]:
+    redis = get_redis_client()
+    if not redis or not texts:
+        return {}
+    try:
+        values = redis.mget([_cache_key(t, target_language) for t in texts])
+    except redis_lib.exceptions.RedisError as e:
+        logger.warning(f"Translation cache read failed: {e}")
+        return {}
+    return {text: value for text, value in zip(texts, values) if value is not None}
+
+
+def _store_translations(translations: Dict[str, str], target_language: str):
+    redis = get_redis_client()
+    if not redis or not translations:
+        return
+    try:
+        with redis.pipeline() as pipe:
+            for text, value in translations.items():
+                pipe.set(_cache_key(text, target_language), value, ex=TRANSLATION_CACHE_TTL_SECONDS)
+            pipe.execute()
+    except redis_lib.exceptions.RedisError as e:
+        logger.warning(f"Translation cache write failed: {e}")
+
+
+def _chunk_by_token_budget(texts: List[str]) -> List[List[str]]:
+    chunks, current, current_tokens = [], [], 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if current and (current_tokens + tokens > TRANSLATION_CHUNK_TOKENS or len(current) >= TRANSLATION_CHUNK_MAX_ITEMS):
+            chunks.append(current)
+            current, current_tokens = [], 0
+        current.append(text)
+        current_tokens += tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+async def _translate_chunk(texts: List[str], target_language: str, semaphore: asyncio.Semaphore) -> List[str]:
+    """
+    Translates a list of strings in one structured-output call. If the batch
+    comes back unusable, the strings are translated one by one, concurrently.
+    Every Gemini call holds `semaphore`, so the fallback respects the same cap.
+    """
+    language_name = SUPPORTED_LANGUAGES[target_language]
+    prompt = f"""
+    Translate every string in the following JSON array into {language_name}.
+    Respond ONLY with a JSON array of the same length, where item i is the translation of input item i.
+    Do not merge, split, reorder or omit items.
+
+    {json.dumps(texts, ensure_ascii=False)}
+    """
+    json_schema = {"type": "ARRAY", "items": {"type": "STRING"}}
+    payload = {"contents": [{"parts": [{"text": prompt}]}],"generationConfig": {"responseMimeType": "application/json", "responseSchema": json_schema}}
+    try:
+        async with semaphore:
+            response_json = await call_gemini_api(payload, priority=PRIORITY_BACKGROUND)
+        translated = json.loads(response_json['candidates'][0]['content']['parts'][0]['text'])
+        if not isinstance(translated, list):
+            logger.warning(f"Batch translation returned a {type(translated).__name__}, not a list. Falling back to per-string calls.")
+        elif len(translated) == len(texts):
+            return [str(t) for t in translated]
+        else:
+            logger.warning(f"Batch translation returned {len(translated)} items for {len(texts)} inputs. Falling back to per-string calls.")
+    except (KeyError, IndexError, ValueError) as e:
+        logger.warning(f"Batch translation failed ({e}). Falling back to per-string calls.")
+
+    async def translate_one(text: str) -> str:
+        async with semaphore:
+            return await translate_text_gemini(text, target_language)
+
+    return list(await asyncio.gather(*(translate_one(text) for text in texts)))
+
+
+async def translate_texts(texts: List[str], target_language: str) -> List[str]:
+    """
+    Translates a list of strings, reusing cached translations and sending the
+    rest as token-budgeted batches that run concurrently under a cap.
+    """
+    if target_language not in SUPPORTED_LANGUAGES:
+        raise ValueError(f"Unsupported language '{target_language}'.")
+    unique_texts = list(dict.fromkeys(t for t in texts if t))
+    translations = _get_cached_translations(unique_texts, target_language)
+    missing = [t for t in unique_texts if t not in translations]
+
+    if missing:
+        semaphore = asyncio.Semaphore(TRANSLATION_CONCURRENCY)
+
+        async def run(chunk: List[str]) -> Dict[str, str]:
+            return dict(zip(chunk, await _translate_chunk(chunk, target_language, semaphore)))
+
+        chunks = _chunk_by_token_budget(missing)
+        logger.info(f"Translating {len(missing)} strings to {target_language} in {len(chunks)} batches "
+                    f"({len(unique_texts) - len(missing)} served from cache).")
+        new_translations: Dict[str, str] = {}
+        for result in await asyncio.gather(*(run(chunk) for chunk in chunks)):
+            new_translations.update(result)
+        _store_translations(new_translations, target_language)
+        translations.update(new_translations)
+
+    return [translations.get(t, t) for t in texts]
+
+
+async def translate_dict_of_lists(texts_dict: Dict[str, List[str]], target_language: str) -> Dict[str, List[str]]:
+    """Translates every list in a dict with a single batched translate_texts call."""
+    flat = [text for texts in texts_dict.values() for text in texts]
+    translated = await translate_texts(flat, target_language)
+    result, offset = {}, 0
+    for key, texts in texts_dict.items():
+        result[key] = translated[offset:offset + len(texts)]
+        offset += len(texts)
+    return result
@@ -0,0 +1,73 @@
+# Backend/uploads.py
+
+import os
+import asyncio
+import hashlib
+import logging
+import tempfile
+from typing import Tuple
+
+from fastapi import UploadFile, HTTPException
+
+from blob_store import store_blob
+
+logger = logging.getLogger(__name__)
+
+# --- Upload Settings ---
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 1024 * 1024))
+MAX_UPLOAD_FILE_BYTES = int(os.getenv("MAX_UPLOAD_FILE_BYTES", 100 * 1024 * 1024))
+MAX_UPLOAD_REQUEST_BYTES = int(os.getenv("MAX_UPLOAD_REQUEST_BYTES", 500 * 1024 * 1024))
+UPLOAD_TMP_DIR = os.getenv("UPLOAD_TMP_DIR", "upload_tmp")
+
+
+class UploadBudget:
+    """Tracks bytes received across all files of one request against MAX_UPLOAD_REQUEST_BYTES."""
+
+    def __init__(self, max_bytes: int = MAX_UPLOAD_REQUEST_BYTES):
+        self.max_bytes = max_bytes
+        self.used = 0
+
+    def consume(self, size: int):
+        self.used += size
+        if self.used > self.max_bytes:
+            raise HTTPException(status_code=413, detail=f"Upload exceeds the {self.max_bytes // (1024 * 1024)} MB per-request limit.")
+
+
+def safe_filename(filename: str) -> str:
+    name = os.path.basename(filename or "")
+    if not name or name in (".", ".."):
+        raise HTTPException(status_code=400, detail="Invalid file name.")
+    return name
+
+
+async def save_upload(file: UploadFile, budget: UploadBudget) -> Tuple[str, str, int]:
+    """
+    Streams an upload to disk in UPLOAD_CHUNK_SIZE pieces, hashing it as it goes,
+    then moves it into the content-addressed blob store (identical content is
+    kept once). Returns (blob path, sha256, size).
+    """
+    filename = safe_filename(file.filename)
+    os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
+    tmp = await asyncio.to_thread(tempfile.NamedTemporaryFile, dir=UPLOAD_TMP_DIR, prefix="upload-", delete=False)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > MAX_UPLOAD_FILE_BYTES:
+                raise HTTPException(status_code=413, detail=f"{filename} exceeds the {MAX_UPLOAD_FILE_BYTES // (1024 * 1024)} MB per-file limit.")
+            budget.consume(len(chunk))
+            digest.update(chunk)
+            await asyncio.to_thread(tmp.write, chunk)
+        await asyncio.to_thread(tmp.close)
+        content_hash = digest.hexdigest()
+        final_path = await asyncio.to_thread(store_blob, tmp.name, content_hash)
+    except BaseException:
+        tmp.close()
+        if os.path.exists(tmp.name):
+            os.remove(tmp.name)
+        raise
+    return final_path, content_hash, size
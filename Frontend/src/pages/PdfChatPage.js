@@ -1013,7 +1013,15 @@ const PdfChatPage = ({ userToken }) => {
       setFilePromise(null);
       if (sessionData.file_paths && sessionData.file_paths.length > 0) {
         const filePromises = sessionData.file_paths.map(async (path) => {
-          const fileName = path.split("/").pop();
+          // /files/<sha256>/<name> URLs percent-encode the name; legacy
+          // /session_files URLs carry it raw (and may contain a bare "%")
+          const lastSegment = path.split("/").pop();
+          let fileName = lastSegment;
+          try {
+            fileName = decodeURIComponent(lastSegment);
+          } catch (e) {
+            fileName = lastSegment;
+          }
           const fileResponse = await apiClient.get(path, {
             responseType: "blob",
           });